@@ -1,5 +1,10 @@
 from django.contrib import admin
-from .models import Profile, LLMProvider, LLMModel, TestRun, TestResult
+from .models import Profile, LLMProvider, LLMModel, TestBatch, RecurringRun, TestRun, TestResult, LLMResponseCache, Blob
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+import json
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
@@ -15,22 +20,105 @@ class LLMProviderAdmin(admin.ModelAdmin):
 
 @admin.register(LLMModel)
 class LLMModelAdmin(admin.ModelAdmin):
-    list_display = ('provider', 'model_name', 'is_active', 'capabilities', 'date_created', 'date_modified')
+    list_display = ('provider', 'model_name', 'is_active', 'capabilities', 'requests_per_minute', 'tokens_per_minute', 'input_price_per_million', 'output_price_per_million', 'date_created', 'date_modified')
     readonly_fields = ('date_created', 'date_modified')
     list_filter = ('provider', 'is_active', 'capabilities')
     search_fields = ('provider__name', 'model_name')
 
+@admin.register(TestBatch)
+class TestBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'profile', 'name', 'status', 'total_runs', 'max_active_runs', 'date_created')
+    readonly_fields = ('date_created', 'date_modified')
+    list_filter = ('status',)
+    search_fields = ('id', 'name', 'profile__user__username')
+
+@admin.register(RecurringRun)
+class RecurringRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'profile', 'product', 'is_active', 'interval_hours', 'freshness_hours', 'date_created')
+    readonly_fields = ('date_created', 'date_modified')
+    list_filter = ('is_active', 'product_category')
+    search_fields = ('id', 'product', 'profile__user__username')
+
 @admin.register(TestRun)
 class TestRunAdmin(admin.ModelAdmin):
-    list_display = ('id', 'profile', 'product', 'status', 'total_tests', 'completed_tests', 'date_created')
-    readonly_fields = ('date_created', 'date_modified')
-    list_filter = ('status', 'product_category')
-    search_fields = ('id', 'product', 'profile__user__username', 'product_category', 'product_description')
+    list_display = ('id', 'profile', 'product', 'status', 'total_tests', 'completed_tests', 'failed_tests', 'cache_hits', 'cache_misses', 'rate_limit_wait_seconds', 'prompt_tokens', 'completion_tokens', 'cost', 'date_created')
+    readonly_fields = ('date_created', 'date_modified', 'waterfall_link')
+    list_filter = ('status', 'product_category', 'cassette_mode')
+    search_fields = ('id', 'batch__id', 'product', 'profile__user__username', 'product_category', 'product_description')
+    raw_id_fields = ('batch', 'recurring_run', 'previous_run')
+
+    def get_urls(self):
+        urls = [
+            path('<path:object_id>/waterfall/', self.admin_site.admin_view(self.waterfall_view), name='core_testrun_waterfall'),
+        ]
+        return urls + super().get_urls()
+
+    @admin.display(description='Trace')
+    def waterfall_link(self, obj):
+        if obj.pk is None:
+            return '-'
+        return format_html('<a href="{}">View waterfall</a>', reverse('admin:core_testrun_waterfall', args=[obj.pk]))
+
+    def waterfall_view(self, request, object_id):
+        """Every traced span of the run, positioned on one timeline starting at the run's creation"""
+        test_run = get_object_or_404(TestRun, pk=object_id)
+        run_start = test_run.date_created.timestamp()
+        results = test_run.results.select_related('llm_model').exclude(trace=None).order_by('date_created')
+
+        rows = []
+        for result in results:
+            depths = {}
+            for span_id, parent_id, name, start_ms, duration_ms, attributes in result.trace["spans"]:
+                depths[span_id] = depths.get(parent_id, -1) + 1
+                rows.append({
+                    "result": result,
+                    "name": name,
+                    "depth": depths[span_id],
+                    "start": result.trace["start"] - run_start + start_ms / 1000,
+                    "duration": duration_ms / 1000,
+                    "attributes": attributes
+                })
+
+        end = max((row["start"] + row["duration"] for row in rows), default=0) or 1
+        for row in rows:
+            row["left"] = round(max(row["start"], 0) / end * 100, 3)
+            row["width"] = max(round(row["duration"] / end * 100, 3), 0.1)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": f"Waterfall for {test_run.product}",
+            "test_run": test_run,
+            "rows": rows,
+            "total_seconds": end
+        }
+        return TemplateResponse(request, "admin/core/testrun/waterfall.html", context)
 
 @admin.register(TestResult)
 class TestResultAdmin(admin.ModelAdmin):
-    list_display = ('id', 'test_run', 'llm_model', 'test_name', 'success', 'date_created')
-    readonly_fields = ('date_created',)
+    list_display = ('id', 'test_run', 'llm_model', 'test_name', 'success', 'llm_calls', 'prompt_tokens', 'completion_tokens', 'llm_latency_seconds', 'cost', 'date_created')
+    readonly_fields = ('date_created', 'raw_responses_blob', 'stored_raw_responses')
+    exclude = ('raw_responses',)
     list_filter = ('success', 'test_name', 'llm_model')
     search_fields = ('id', 'test_run__id', 'test_name', 'llm_model__model_name', 'error', 'readable_response')
 
+    @admin.display(description='Raw responses')
+    def stored_raw_responses(self, obj):
+        raw_responses = obj.get_raw_responses()
+        if raw_responses is None:
+            return '-'
+        return format_html('<pre>{}</pre>', json.dumps(raw_responses, indent=2, default=str))
+
+@admin.register(LLMResponseCache)
+class LLMResponseCacheAdmin(admin.ModelAdmin):
+    list_display = ('key', 'provider', 'model_name', 'expires_at', 'date_created')
+    readonly_fields = ('date_created',)
+    list_filter = ('provider', 'model_name')
+    search_fields = ('key', 'model_name')
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'codec', 'size', 'date_created')
+    readonly_fields = ('digest', 'codec', 'size', 'date_created')
+    exclude = ('data',)
+    search_fields = ('digest',)
@@ -10,6 +10,8 @@ class CoreConfig(AppConfig):
         from .llms.adapters.openai import OpenAI
         from .llms.tests import MentionFrequencyTest, FeatureRecognitionTest, ProductSentimentAnalysisTest, CompetitorComparisonTest
         from .llms.tests.registry import test_registry
+        from .llms import catalog  # noqa: F401 - connects the catalog invalidation signals
+        from .tasks import recurring_tasks  # noqa: F401 - connects the recurring run schedule signals
         
         # providers registry
         provider_registry.register("OpenAI", OpenAI)
@@ -0,0 +1,61 @@
+from datetime import timedelta
+from typing import Any, Tuple
+from django.conf import settings
+from django.utils import timezone
+from core.models import Blob
+import gzip
+import hashlib
+import json
+
+try:
+    import zstandard
+except ImportError:  # gzip is used when zstandard isn't installed
+    zstandard = None
+
+def _encode(value: Any) -> bytes:
+    """Canonical JSON bytes, so equal payloads always hash the same"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+def compress(raw: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return Blob.Codec.ZSTD, zstandard.ZstdCompressor(level=10).compress(raw)
+    return Blob.Codec.GZIP, gzip.compress(raw, compresslevel=6)
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == Blob.Codec.ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed blobs")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def store_json(value: Any) -> str:
+    """Store a JSON-serializable value once and return its content digest"""
+    raw = _encode(value)
+    digest = hashlib.sha256(raw).hexdigest()
+    # Marking an existing blob as used doubles as the existence check
+    if not Blob.objects.filter(digest=digest).update(date_used=timezone.now()):
+        codec, data = compress(raw)
+        # A concurrent writer storing the same content is harmless
+        Blob.objects.bulk_create(
+            [Blob(digest=digest, codec=codec, size=len(raw), data=data)],
+            ignore_conflicts=True
+        )
+    return digest
+
+def load_json(digest: str) -> Any:
+    codec, data = Blob.objects.values_list("codec", "data").get(digest=digest)
+    return json.loads(decompress(codec, bytes(data)))
+
+def delete_orphans(grace_seconds: int | None = None) -> int:
+    """
+    Delete blobs no TestResult refers to anymore, returning how many were removed.
+    Blobs stored or reused within the grace period are kept, since a worker
+    may be about to insert the result that refers to them.
+    """
+    if grace_seconds is None:
+        grace_seconds = getattr(settings, "BLOB_ORPHAN_GRACE_SECONDS", 60 * 60)
+    deleted, _ = Blob.objects.filter(
+        test_results__isnull=True,
+        date_used__lt=timezone.now() - timedelta(seconds=grace_seconds)
+    ).delete()
+    return deleted
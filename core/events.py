@@ -0,0 +1,117 @@
+from collections import defaultdict
+from typing import Dict, Set
+from django.conf import settings
+from django.db import connection, DatabaseError
+from psycopg import sql
+import asyncio
+import json
+import logging
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+# All test run events share one Postgres NOTIFY channel so each web process
+# needs a single listening connection regardless of how many clients watch
+CHANNEL = "test_run_events"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+def publish_run_event(test_run_id: str, event_type: str, data: dict):
+    """Notify listeners of a test run event. Delivered when the current transaction commits."""
+    if connection.vendor != "postgresql":
+        return
+
+    event = {"test_run_id": test_run_id, "type": event_type, **data}
+    payload = json.dumps(event, default=str)
+    if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+        # Drop the partial result but keep the progress fields
+        event = {k: v for k, v in event.items() if k != "partial"}
+        event["truncated"] = True
+        payload = json.dumps(event, default=str)
+
+    # Events are best effort; a failed notify must not fail the test
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+    except DatabaseError:
+        logger.exception(f"Could not publish {event_type} event for test run {test_run_id}")
+
+class RunEventHub:
+    """
+    Per-process fan-out of test run notifications to async subscribers.
+    A single LISTEN connection is opened lazily on the running event loop.
+    """
+    RECONNECT_DELAY = 1.0
+    # Seconds subscribe waits for the listener before giving up on live events
+    LISTEN_TIMEOUT = getattr(settings, "RUN_EVENTS_LISTEN_TIMEOUT", 5.0)
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._listener = None
+        self._listening = None
+
+    async def subscribe(self, test_run_id: str) -> asyncio.Queue:
+        """
+        Start receiving events for a test run. Returns once the listener is active,
+        or after LISTEN_TIMEOUT seconds if it can't connect; events arrive once it does.
+        """
+        if self._listener is None or self._listener.done():
+            self._listening = asyncio.Event()
+            self._listener = asyncio.create_task(self._listen())
+        queue = asyncio.Queue()
+        self._subscribers[test_run_id].add(queue)
+        try:
+            await asyncio.wait_for(self._listening.wait(), self.LISTEN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Test run event listener not connected, streaming {test_run_id} without waiting for it")
+        except BaseException:
+            # Cancelled, e.g. by the client disconnecting, before events() could clean up
+            self.unsubscribe(test_run_id, queue)
+            raise
+        return queue
+
+    def unsubscribe(self, test_run_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(test_run_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[test_run_id]
+
+    async def _listen(self):
+        db = settings.DATABASES["default"]
+        conninfo = {
+            "dbname": db.get("NAME"),
+            "user": db.get("USER") or None,
+            "password": db.get("PASSWORD") or None,
+            "host": db.get("HOST") or None,
+            "port": db.get("PORT") or None,
+        }
+        while True:
+            try:
+                aconn = await psycopg.AsyncConnection.connect(
+                    autocommit=True,
+                    **{k: v for k, v in conninfo.items() if v is not None}
+                )
+                async with aconn:
+                    await aconn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(CHANNEL)))
+                    self._listening.set()
+                    async for notify in aconn.notifies():
+                        self._dispatch(notify.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._listening.clear()
+                logger.exception("Test run event listener disconnected, reconnecting")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+
+    def _dispatch(self, payload: str):
+        try:
+            event = json.loads(payload)
+        except json.JSONDecodeError:
+            return
+        for queue in self._subscribers.get(event.get("test_run_id"), ()):
+            queue.put_nowait(event)
+
+# Module-level singleton
+run_event_hub = RunEventHub()
@@ -1,17 +1,271 @@
 # llms/base.py
 from abc import ABC, abstractmethod
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Type, FrozenSet, Generator, Iterator, Callable
 from core.models import LLMModel
 from django.conf import settings
 from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from django.db import connections
+from requests.adapters import HTTPAdapter
+from core.llms.cache import response_cache, make_cache_key
+from core.llms.context import current_context, count_db_queries, LLMCallContext
+from core.metrics import LLM_REQUESTS, LLM_REQUEST_DURATION, LLM_IN_FLIGHT, LLM_TIME_TO_FIRST_TOKEN, LLM_TOKENS_PER_SECOND
+from core.llms.ratelimit import rate_limiter
+from core.llms.tracing import trace_span
+from core.llms.cassette import cassettes, CassetteMissError, RECORD, REPLAY
+import contextvars
+import json
+import requests
+import threading
+import random
+import time
+import os
+
+# Keep-alive sessions per adapter class, rebuilt after a fork so that worker
+# processes never share sockets with their parent
+_sessions: Dict[Type["BaseLLM"], requests.Session] = {}
+_sessions_pid = None
+_sessions_lock = threading.Lock()
 
 @dataclass
 class APIResponse:
     details: str
     success: bool = False
 
+class LLMRequestError(Exception):
+    """A provider request that failed, with the HTTP status and Retry-After delay when known"""
+
+    def __init__(self, message: str, status_code: int | None = None, retry_after: float | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class CircuitOpenError(LLMRequestError):
+    """Raised without contacting the provider while its circuit breaker is open"""
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse a Retry-After header given either in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 4
+    # Exponential backoff: base_delay * 2 ** (attempt - 1), capped at max_delay
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    # Fraction of each delay that is randomized to spread out retries
+    jitter: float = 0.5
+    retry_statuses: FrozenSet[int] = frozenset({408, 429, 500, 502, 503, 504})
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, CircuitOpenError):
+            return False
+        if isinstance(error, LLMRequestError):
+            return error.status_code is None or error.status_code in self.retry_statuses
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+    def get_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return backoff * (1 - self.jitter) + random.uniform(0, backoff * self.jitter)
+
+class CircuitBreaker:
+    """
+    Fails fast once a provider has produced failure_threshold consecutive
+    retryable failures. After reset_timeout seconds a single probe request is
+    let through; its outcome closes or re-opens the circuit. A probe that
+    never reports back is replaced by another after a further reset_timeout.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+# One breaker per provider, shared by every thread in the worker
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(provider_name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(provider_name)
+        if breaker is None:
+            breaker = CircuitBreaker(**getattr(settings, "LLM_CIRCUIT_BREAKER", {}))
+            _breakers[provider_name] = breaker
+        return breaker
+
+@dataclass
+class QueryResult:
+    query: dict
+    response: dict = None
+    error: Exception = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+class StreamingResponse:
+    """
+    Iterates over content deltas as they arrive. Once the stream is consumed,
+    response holds the assembled response in the same format query() returns,
+    alongside time-to-first-token and generation speed. Timing starts with
+    iteration; abandoning the iteration cancels the stream. Given labels, the
+    call is recorded in the request metrics and as an llm.stream span.
+    """
+
+    def __init__(
+        self,
+        deltas: Generator[str, None, dict],
+        on_complete: Callable[[dict], None] | None = None,
+        on_error: Callable[[], None] | None = None,
+        labels: dict | None = None,
+        span: dict | None = None
+    ):
+        self._deltas = deltas
+        self._on_complete = on_complete
+        self._on_error = on_error
+        self._labels = labels
+        self._span = span if span is not None else {}
+        self._context = current_context()
+        self._started = None
+        self._consumed = False
+        self.response = None
+        self.time_to_first_token = None
+        self.duration = None
+        self.tokens_per_second = None
+
+    def __iter__(self) -> Iterator[str]:
+        if self._consumed:
+            return
+        if self._started is None:
+            self._started = time.monotonic()
+            self._wall_start = time.time()
+        chunks = 0
+        outcome = "error"
+        try:
+            while True:
+                try:
+                    delta = next(self._deltas)
+                except StopIteration as stop:
+                    self.response = stop.value
+                    break
+                if self.time_to_first_token is None:
+                    self.time_to_first_token = time.monotonic() - self._started
+                chunks += 1
+                yield delta
+            outcome = "success"
+        except GeneratorExit:
+            outcome = "cancelled"
+            self._deltas.close()
+            raise
+        except Exception:
+            if self._on_error is not None:
+                self._on_error()
+            raise
+        finally:
+            self._consumed = True
+            self.duration = time.monotonic() - self._started
+            self._record_metrics(chunks, outcome)
+
+        if self._on_complete is not None:
+            self._on_complete(self.response)
+
+    def read(self) -> dict:
+        """Consume any remaining deltas and return the assembled response"""
+        for _ in self:
+            pass
+        return self.response
+
+    def _record_metrics(self, chunks: int, outcome: str):
+        # Providers send roughly one token per chunk when they don't report usage
+        usage = (self.response or {}).get("usage") or {}
+        tokens = usage.get("completion_tokens") or chunks
+        generation_time = self.duration - (self.time_to_first_token or 0)
+        if outcome == "success" and generation_time > 0:
+            self.tokens_per_second = tokens / generation_time
+
+        context = self._context
+        if context is not None:
+            context.stats.incr("streamed_calls")
+            context.stats.incr("time_to_first_token_seconds", self.time_to_first_token or 0)
+        if self._labels is None:
+            return
+
+        LLM_REQUESTS.inc(outcome=outcome, **self._labels)
+        LLM_REQUEST_DURATION.observe(self.duration, outcome=outcome, **self._labels)
+        if self.time_to_first_token is not None:
+            LLM_TIME_TO_FIRST_TOKEN.observe(self.time_to_first_token, **self._labels)
+        if self.tokens_per_second is not None:
+            LLM_TOKENS_PER_SECOND.observe(self.tokens_per_second, **self._labels)
+        if context is not None:
+            context.tracer.add_span(
+                "llm.stream",
+                self._wall_start,
+                self.duration,
+                outcome=outcome,
+                time_to_first_token=round(self.time_to_first_token, 3) if self.time_to_first_token is not None else None,
+                tokens_per_second=round(self.tokens_per_second, 1) if self.tokens_per_second is not None else None,
+                **self._span
+            )
+
 class BaseLLM(ABC):
-    GATEWAY_URL = f"https://gateway.ai.cloudflare.com/v1/{settings.CLOUDFLARE_ACCOUNT_ID}/llm-tests/"
+    # Set LLM_GATEWAY_URL to use another gateway, such as core.llms.mock_gateway
+    GATEWAY_URL = getattr(settings, "LLM_GATEWAY_URL", None) or f"https://gateway.ai.cloudflare.com/v1/{settings.CLOUDFLARE_ACCOUNT_ID}/llm-tests/"
+    # Upper bound on in-flight requests for a single query_many call
+    MAX_CONCURRENCY = getattr(settings, "LLM_MAX_CONCURRENCY", 8)
+    # Number of keep-alive connections held open to the gateway per provider
+    HTTP_POOL_SIZE = getattr(settings, "LLM_HTTP_POOL_SIZE", MAX_CONCURRENCY)
+    # Seconds to wait for a single gateway response
+    REQUEST_TIMEOUT = getattr(settings, "LLM_REQUEST_TIMEOUT", 120)
+    RETRY_POLICY = RetryPolicy(**getattr(settings, "LLM_RETRY_POLICY", {}))
+    # Adapters that implement _stream set this; others stream the full answer as one delta
+    SUPPORTS_STREAMING = False
+    # Seconds without a new chunk before a streamed generation is treated as stalled
+    STREAM_STALL_TIMEOUT = getattr(settings, "LLM_STREAM_STALL_TIMEOUT", 30)
 
     def __init__(self, model: LLMModel):
         self.model = model
@@ -26,12 +280,327 @@ class BaseLLM(ABC):
         """Return the name of the model"""
         pass
 
-    @abstractmethod
     def query(self, query: dict) -> dict:
-        """Send a query to the LLM and return the response"""
+        """Send a query to the LLM and return the response, serving repeats from the response cache"""
+        context = current_context()
+        labels = self._request_labels(context)
+        key = make_cache_key(labels["provider"], self.model.model_name, query)
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            with trace_span("llm.query", model=self.model.model_name, prompt_hash=key[:12]) as span:
+                response, stored_outcome = self._lookup(query, key, context)
+                span["replayed"] = stored_outcome == "replay" or None
+                span["cached"] = stored_outcome == "cache_hit"
+                if response is None:
+                    call_started = time.monotonic()
+                    response = self._send_with_retry(query)
+                    self._store(query, key, response, time.monotonic() - call_started, context)
+            outcome = stored_outcome or "success"
+            return response
+        finally:
+            self._observe_request(labels, outcome, started)
+
+    def _request_labels(self, context: LLMCallContext | None) -> dict:
+        return {
+            "provider": self.model.provider.name,
+            "model": self.model.model_name,
+            "test_name": (context.test_name if context is not None else None) or ""
+        }
+
+    @staticmethod
+    def _observe_request(labels: dict, outcome: str, started: float):
+        LLM_REQUESTS.inc(outcome=outcome, **labels)
+        LLM_REQUEST_DURATION.observe(time.monotonic() - started, outcome=outcome, **labels)
+
+    @staticmethod
+    def _use_cache(context: LLMCallContext | None) -> bool:
+        return response_cache.enabled and not (context is not None and context.cache_bypass)
+
+    def _lookup(self, query: dict, key: str, context: LLMCallContext | None) -> tuple[dict | None, str | None]:
+        """
+        Return a recorded or cached response and its outcome, "replay" or
+        "cache_hit", or (None, None) when the query has to be sent
+        """
+        mode = cassettes.mode_for(context)
+        if mode == REPLAY:
+            return self._replay_recorded(key, context), "replay"
+        if not self._use_cache(context):
+            return None, None
+
+        started = time.monotonic()
+        with trace_span("cache.get") as span:
+            response = response_cache.get(key, context.cache_max_age if context is not None else None)
+            span["hit"] = response is not None
+        if context is not None:
+            context.stats.incr("cache_hits" if response is not None else "cache_misses")
+        if response is None:
+            return None, None
+
+        if mode == RECORD:
+            self._record_to_cassette(key, query, response, time.monotonic() - started, context)
+        return response, "cache_hit"
+
+    def _store(self, query: dict, key: str, response: dict, latency: float, context: LLMCallContext | None):
+        """Keep a provider's response: on the cassette in record mode, and in the response cache"""
+        if cassettes.mode_for(context) == RECORD:
+            self._record_to_cassette(key, query, response, latency, context)
+        if self._use_cache(context) and self.is_cacheable(response):
+            response_cache.set(
+                key,
+                self.model.provider.name,
+                self.model.model_name,
+                response,
+                ttl=context.cache_ttl if context is not None else None
+            )
+
+    def _replay_recorded(self, key: str, context: LLMCallContext | None) -> dict:
+        """Serve a response from the context's cassette, without touching the network"""
+        entry = cassettes.cassette_for(context).get(key)
+        if entry is None:
+            raise CassetteMissError(f"No recorded response for {self.model.model_name} query {key[:12]}")
+        cassettes.simulate_latency(entry)
+        if context is not None:
+            context.stats.incr("replayed_calls")
+        return entry["response"]
+
+    def _record_to_cassette(self, key: str, query: dict, response: dict, latency: float, context: LLMCallContext | None):
+        cassettes.cassette_for(context).record(key, self.model.provider.name, self.model.model_name, query, response, latency)
+        if context is not None:
+            context.stats.incr("recorded_calls")
+
+    @abstractmethod
+    def _send(self, query: dict) -> dict:
+        """Send a query to the provider and return the raw response, raising LLMRequestError on failure"""
         pass
 
+    def _send_with_retry(self, query: dict) -> dict:
+        """Call _send under the retry policy and the provider's circuit breaker"""
+        policy = self.RETRY_POLICY
+        breaker = get_circuit_breaker(self.model.provider.name)
+        labels = {"provider": self.model.provider.name, "model": self.model.model_name}
+        attempt = 0
+
+        LLM_IN_FLIGHT.inc(**labels)
+        try:
+            while True:
+                attempt += 1
+                self._acquire_send_slot(breaker, query)
+                # Latency covers the provider call alone, not rate limit waits or backoff
+                started = time.monotonic()
+                try:
+                    with trace_span("http.send", attempt=attempt):
+                        response = self._send(query)
+                except Exception as e:
+                    retryable = self._record_failure(breaker, e)
+                    if not retryable or attempt >= policy.max_attempts:
+                        raise
+                    time.sleep(policy.get_delay(attempt, e))
+                    continue
+
+                breaker.record_success()
+                self._record_usage(response, time.monotonic() - started)
+                return response
+        finally:
+            LLM_IN_FLIGHT.dec(**labels)
+
+    def _record_failure(self, breaker: CircuitBreaker, error: Exception) -> bool:
+        """Report a failed request to the breaker and return whether it may be retried"""
+        retryable = self.RETRY_POLICY.is_retryable(error)
+        # Client errors say nothing about provider health
+        if retryable:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return retryable
+
+    def _record_usage(self, response: dict, latency: float):
+        """Add a provider call's tokens, latency and cost to the current context"""
+        context = current_context()
+        if context is None:
+            return
+        usage = self.extract_usage(response) or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        context.stats.record_call(
+            self.model.model_name,
+            prompt_tokens,
+            completion_tokens,
+            latency,
+            self.model.get_cost(prompt_tokens, completion_tokens)
+        )
+
+    def extract_usage(self, response: dict) -> dict | None:
+        """Return the prompt_tokens and completion_tokens reported in a raw response, if any"""
+        return None
+
+    def _acquire_send_slot(self, breaker: CircuitBreaker, query: dict):
+        """Fail fast if the provider's circuit is open, then wait for rate limit capacity"""
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit open for provider {self.model.provider.name}, not sending request")
+
+        with trace_span("ratelimit.acquire") as span:
+            waited = rate_limiter.acquire(self.model.provider.name, self.model, query)
+            span["waited"] = round(waited, 3)
+        context = current_context()
+        if waited and context is not None:
+            context.stats.incr("rate_limit_wait_seconds", waited)
+
+    def stream(self, query: dict) -> StreamingResponse:
+        """
+        Send a query and return a StreamingResponse yielding content deltas as
+        they are generated. Recorded and cached answers are replayed as a single
+        delta. For adapters that support streaming nothing is sent until the
+        response is iterated; others query right away and replay the answer.
+        """
+        if not self.SUPPORTS_STREAMING:
+            return StreamingResponse(self._replay(self.query(query)))
+
+        context = current_context()
+        labels = self._request_labels(context)
+        key = make_cache_key(labels["provider"], self.model.model_name, query)
+        started = time.monotonic()
+        try:
+            response, outcome = self._lookup(query, key, context)
+        except Exception:
+            self._observe_request(labels, "error", started)
+            raise
+        if response is not None:
+            self._observe_request(labels, outcome, started)
+            return StreamingResponse(self._replay(response))
+
+        def on_complete(response: dict):
+            self._store(query, key, response, streaming.duration, context)
+
+        span = {"model": self.model.model_name, "prompt_hash": key[:12]}
+        streaming = StreamingResponse(self._stream_with_retry(query, labels, span), on_complete=on_complete, labels=labels, span=span)
+        return streaming
+
+    def _stream_with_retry(self, query: dict, labels: dict, span: dict) -> Generator[str, None, dict]:
+        """
+        Call _stream under the retry policy and the provider's circuit breaker.
+        Attempts are retried until the first delta arrives; after that a failure
+        would repeat deltas the caller already has, so it is raised instead.
+        """
+        policy = self.RETRY_POLICY
+        breaker = get_circuit_breaker(self.model.provider.name)
+        attempt = 0
+
+        LLM_IN_FLIGHT.inc(**labels)
+        try:
+            while True:
+                attempt += 1
+                span["attempts"] = attempt
+                self._acquire_send_slot(breaker, query)
+                sent = time.monotonic()
+                deltas = self._stream(query)
+                try:
+                    first = next(deltas)
+                except StopIteration as stop:
+                    breaker.record_success()
+                    self._record_usage(stop.value, time.monotonic() - sent)
+                    return stop.value
+                except Exception as e:
+                    retryable = self._record_failure(breaker, e)
+                    if not retryable or attempt >= policy.max_attempts:
+                        raise
+                    time.sleep(policy.get_delay(attempt, e))
+                    continue
+                break
+
+            # A first delta means the provider is answering
+            breaker.record_success()
+            yield first
+            try:
+                response = yield from deltas
+            except Exception as e:
+                self._record_failure(breaker, e)
+                raise
+            self._record_usage(response, time.monotonic() - sent)
+            return response
+        finally:
+            LLM_IN_FLIGHT.dec(**labels)
+
+    def _stream(self, query: dict) -> Generator[str, None, dict]:
+        """Yield content deltas from the provider and return the assembled raw response"""
+        raise NotImplementedError(f"{type(self).__name__} does not support streaming")
+
+    def _replay(self, response: dict) -> Generator[str, None, dict]:
+        content = self.process_response(response)
+        yield content if isinstance(content, str) else json.dumps(content)
+        return response
+
+    def is_cacheable(self, response: dict) -> bool:
+        """Whether a raw response is a successful answer that may be served again"""
+        return True
+
     @abstractmethod
     def process_response(self, response: dict) -> str:
         """Take the llm api response and return a consistent format"""
-        pass
\ No newline at end of file
+        pass
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """Return the pooled HTTP session for this provider, creating it on first use in the process"""
+        global _sessions_pid
+
+        with _sessions_lock:
+            if _sessions_pid != os.getpid():
+                _sessions.clear()
+                _sessions_pid = os.getpid()
+
+            session = _sessions.get(cls)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cls.HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[cls] = session
+
+            return session
+
+    def query_many(self, queries: List[dict], max_concurrency: int | None = None) -> List[QueryResult]:
+        """
+        Send independent queries concurrently. Results are returned in the same
+        order as the queries, with any exception captured on its QueryResult.
+        """
+        if not queries:
+            return []
+
+        workers = min(max_concurrency or self.MAX_CONCURRENCY, len(queries))
+        with trace_span("llm.query_many", model=self.model.model_name, queries=len(queries), concurrency=workers):
+            if workers <= 1:
+                return [self._query_capturing(query) for query in queries]
+            return self._query_concurrently(queries, workers)
+
+    def _query_concurrently(self, queries: List[dict], workers: int) -> List[QueryResult]:
+        context = current_context()
+        keys = []
+        if response_cache.enabled and not (context is not None and context.cache_bypass) and cassettes.mode_for(context) != REPLAY:
+            keys = [make_cache_key(self.model.provider.name, self.model.model_name, query) for query in queries]
+        # One shared-tier query here saves each pool thread a connection of its own just to look up its key
+        with response_cache.prefetch(keys, context.cache_max_age if context is not None else None), \
+                ThreadPoolExecutor(max_workers=workers) as executor:
+            # Each query runs in a copy of the caller's context so per-test settings and counters apply
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._query_in_thread, query)
+                for query in queries
+            ]
+            return [future.result() for future in futures]
+
+    def _query_in_thread(self, query: dict) -> QueryResult:
+        context = current_context()
+        try:
+            if context is None:
+                return self._query_capturing(query)
+            with count_db_queries(context.stats):
+                return self._query_capturing(query)
+        finally:
+            # Pool threads are discarded after the call, so close any DB connection they opened, e.g. for cache writes
+            connections.close_all()
+
+    def _query_capturing(self, query: dict) -> QueryResult:
+        try:
+            return QueryResult(query=query, response=self.query(query))
+        except Exception as e:
+            return QueryResult(query=query, error=e)
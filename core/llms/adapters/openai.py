@@ -1,12 +1,13 @@
 # llms/openai.py
-from .base import BaseLLM, APIResponse
+from .base import BaseLLM, APIResponse, LLMRequestError, parse_retry_after
 from django.conf import settings
 from core.models import LLMModel
-import requests
-from typing import List
+from typing import List, Generator
 import json
 
 class OpenAI(BaseLLM):
+    SUPPORTS_STREAMING = True
+
     def __init__(self, model: LLMModel):
         self._api_key = settings.OPENAI_API_KEY
         self.model = model
@@ -17,7 +18,8 @@ class OpenAI(BaseLLM):
     def name(self) -> str:
         return self.model.model_name
 
-    def query(self, query: dict) -> dict:
+    def _gateway_request(self, query: dict) -> tuple[dict, list]:
+        """Build the headers and universal endpoint payload for a chat completion"""
         query["model"] = self.model.model_name
 
         headers = {
@@ -35,29 +37,85 @@ class OpenAI(BaseLLM):
                 "query": query
             }
         ]
-        
-        # First attempt
-        response = requests.post(
+        return headers, data
+
+    def _raise_for_status(self, response):
+        if response.status_code != 200:
+            try:
+                error_message = response.json()
+            except ValueError:
+                error_message = response.text
+            raise LLMRequestError(
+                f"OpenAI API request failed with status {response.status_code}: {error_message}",
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get("Retry-After"))
+            )
+
+    def _send(self, query: dict) -> dict:
+        headers, data = self._gateway_request(query)
+        response = self.get_session().post(
             self.GATEWAY_URL,
             headers=headers,
-            json=data
+            json=data,
+            timeout=self.REQUEST_TIMEOUT
         )
-        
-        # Retry once if we get a 500 error
-        if response.status_code == 500:
-            response = requests.post(
-                self.GATEWAY_URL,
-                headers=headers,
-                json=data
-            )
-            
-            # If still failing after retry, raise exception with error details
-            if response.status_code != 200:
-                error_message = response.json()
-                raise Exception(f"OpenAI API request failed after retry: {error_message}")
-        
+        self._raise_for_status(response)
         return response.json()
 
+    def _stream(self, query: dict) -> Generator[str, None, dict]:
+        # Send a copy so the cache key of the caller's query is unaffected
+        stream_query = dict(query, stream=True, stream_options={"include_usage": True})
+        headers, data = self._gateway_request(stream_query)
+        response = self.get_session().post(
+            self.GATEWAY_URL,
+            headers=headers,
+            json=data,
+            stream=True,
+            # The read timeout applies between chunks, so it catches stalled generations
+            timeout=(self.REQUEST_TIMEOUT, self.STREAM_STALL_TIMEOUT)
+        )
+
+        with response:
+            self._raise_for_status(response)
+
+            parts = []
+            assembled = {"choices": [{"index": 0, "message": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+
+                chunk = json.loads(payload)
+                for key in ("id", "object", "created", "model", "system_fingerprint"):
+                    if key in chunk:
+                        assembled[key] = chunk[key]
+                if chunk.get("usage"):
+                    assembled["usage"] = chunk["usage"]
+
+                for choice in chunk.get("choices", []):
+                    if choice.get("finish_reason"):
+                        assembled["choices"][0]["finish_reason"] = choice["finish_reason"]
+                    delta = choice.get("delta", {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+
+        assembled["object"] = "chat.completion"
+        assembled["choices"][0]["message"]["content"] = "".join(parts)
+        # Mirror the gateway tag process_response uses to decide whether to parse JSON
+        if "response_format" in query:
+            usage = assembled.setdefault("usage", {})
+            usage["system_tags"] = list(usage.get("system_tags", [])) + ["response_format"]
+        return assembled
+
+    def extract_usage(self, response: dict) -> dict | None:
+        return response.get("usage")
+
+    def is_cacheable(self, response: dict) -> bool:
+        return "choices" in response
+
     def process_response(self, response: dict) -> str | dict:
         """
         Process the LLM API response and return either a string or structured data
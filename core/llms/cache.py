@@ -0,0 +1,186 @@
+# llms/cache.py
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from typing import Iterable, Iterator
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from core.models import LLMResponseCache
+import hashlib
+import itertools
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Keys whose shared-tier rows were already loaded by ResponseCache.prefetch, copied into query_many threads
+_prefetched: ContextVar[frozenset] = ContextVar("llm_cache_prefetched", default=frozenset())
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+def make_cache_key(provider: str, model_name: str, query: dict) -> str:
+    """Hash of the provider, model and whitespace-normalized query in canonical JSON form"""
+    # Adapters write the model into the query themselves
+    normalized = _normalize({k: v for k, v in query.items() if k != "model"})
+    payload = json.dumps(
+        {"provider": provider, "model": model_name, "query": normalized},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LRUCache:
+    """Size-bounded in-process cache whose entries expire after their TTL"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, max_age: float | None = None):
+        """Return the value, or None if it is missing, expired or older than max_age seconds"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, stored_at = entry
+            now = time.monotonic()
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            if max_age is not None and now - stored_at > max_age:
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: int, age: float = 0):
+        """Store a value for ttl seconds; age is how old the value already is"""
+        with self._lock:
+            now = time.monotonic()
+            self._entries[key] = (value, now + ttl, now - age)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class ResponseCache:
+    """
+    Two-tier LLM response cache: a per-process LRU in front of the shared
+    LLMResponseCache table.
+    """
+    DEFAULT_TTL = getattr(settings, "LLM_CACHE_TTL", 24 * 60 * 60)
+    # Bounds for the shared table; pruning runs every PRUNE_INTERVAL writes
+    MAX_DB_ENTRIES = getattr(settings, "LLM_CACHE_DB_MAX_ENTRIES", 100_000)
+    PRUNE_INTERVAL = getattr(settings, "LLM_CACHE_PRUNE_INTERVAL", 500)
+
+    def __init__(self):
+        self.enabled = getattr(settings, "LLM_CACHE_ENABLED", True)
+        self.persistent = getattr(settings, "LLM_CACHE_PERSISTENT", True)
+        self.local = LRUCache(getattr(settings, "LLM_CACHE_LOCAL_MAX_ENTRIES", 1024))
+        self._writes = itertools.count(1)
+
+    def get(self, key: str, max_age: float | None = None) -> dict | None:
+        """Return a cached response, ignoring any stored more than max_age seconds ago"""
+        response = self.local.get(key, max_age)
+        if response is not None or not self.persistent or key in _prefetched.get():
+            return response
+
+        # The shared tier is an optimization; an unreachable database is a miss
+        now = timezone.now()
+        entries = LLMResponseCache.objects.filter(key=key, expires_at__gt=now)
+        if max_age is not None:
+            entries = entries.filter(date_modified__gte=now - timedelta(seconds=max_age))
+        try:
+            entry = entries.values_list("response", "expires_at", "date_modified").first()
+        except DatabaseError:
+            logger.warning("Response cache lookup failed, treating as a miss", exc_info=True)
+            return None
+        if entry is None:
+            return None
+
+        response, expires_at, stored_at = entry
+        # Promote into the local tier for no longer than the row has left
+        remaining = (expires_at - now).total_seconds()
+        if remaining > 0:
+            self.local.set(key, response, int(remaining), age=(now - stored_at).total_seconds())
+        return response
+
+    @contextmanager
+    def prefetch(self, keys: Iterable[str], max_age: float | None = None) -> Iterator[None]:
+        """
+        Load the shared-tier rows for keys into the local tier with one query, so
+        that get() for those keys inside the block never touches the database
+        """
+        keys = {key for key in keys if self.local.get(key, max_age) is None}
+        if not keys or not self.persistent:
+            yield
+            return
+
+        now = timezone.now()
+        entries = LLMResponseCache.objects.filter(key__in=keys, expires_at__gt=now)
+        if max_age is not None:
+            entries = entries.filter(date_modified__gte=now - timedelta(seconds=max_age))
+        try:
+            rows = list(entries.values_list("key", "response", "expires_at", "date_modified"))
+        except DatabaseError:
+            logger.warning("Response cache prefetch failed, leaving lookups to get()", exc_info=True)
+            yield
+            return
+        for key, response, expires_at, stored_at in rows:
+            remaining = (expires_at - now).total_seconds()
+            if remaining > 0:
+                self.local.set(key, response, int(remaining), age=(now - stored_at).total_seconds())
+
+        token = _prefetched.set(_prefetched.get() | keys)
+        try:
+            yield
+        finally:
+            _prefetched.reset(token)
+
+    def set(self, key: str, provider: str, model_name: str, response: dict, ttl: int | None = None):
+        ttl = ttl or self.DEFAULT_TTL
+        self.local.set(key, response, ttl)
+        if not self.persistent:
+            return
+
+        try:
+            LLMResponseCache.objects.update_or_create(
+                key=key,
+                defaults={
+                    "provider": provider,
+                    "model_name": model_name,
+                    "response": response,
+                    "expires_at": timezone.now() + timedelta(seconds=ttl)
+                }
+            )
+            if next(self._writes) % self.PRUNE_INTERVAL == 0:
+                self.prune()
+        except DatabaseError:
+            logger.warning("Response cache write failed", exc_info=True)
+
+    def prune(self):
+        """Delete expired rows and the oldest rows beyond MAX_DB_ENTRIES"""
+        LLMResponseCache.objects.filter(expires_at__lte=timezone.now()).delete()
+        cutoff = LLMResponseCache.objects.order_by("-date_created").values_list(
+            "date_created", flat=True
+        )[self.MAX_DB_ENTRIES:self.MAX_DB_ENTRIES + 1].first()
+        if cutoff is not None:
+            LLMResponseCache.objects.filter(date_created__lte=cutoff).delete()
+
+# Module-level singleton
+response_cache = ResponseCache()
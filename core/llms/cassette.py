@@ -0,0 +1,106 @@
+# llms/cassette.py
+from django.conf import settings
+from typing import Dict
+import json
+import os
+import re
+import threading
+import time
+
+RECORD = "record"
+REPLAY = "replay"
+OFF = "off"
+
+class CassetteMissError(Exception):
+    """Raised in replay mode when a query was never recorded"""
+    pass
+
+class Cassette:
+    """
+    Recorded request/response pairs in a JSONL file, keyed by the canonical
+    query hash from make_cache_key. Later recordings of a key win.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, dict] | None = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, dict]:
+        if self._entries is None:
+            entries = {}
+            if os.path.exists(self.path):
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            entries[entry["key"]] = entry
+            self._entries = entries
+        return self._entries
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            return self._load().get(key)
+
+    def record(self, key: str, provider: str, model_name: str, query: dict, response: dict, latency: float):
+        entry = {
+            "key": key,
+            "provider": provider,
+            "model": model_name,
+            "query": query,
+            "response": response,
+            "latency": round(latency, 4)
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._load()[key] = entry
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # One write per line keeps appends from concurrent workers whole
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+class CassetteLibrary:
+    """
+    Resolves the record/replay mode and cassette for the current call context,
+    falling back to the LLM_CASSETTE_MODE and LLM_CASSETTE settings.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._cassettes = {}
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    @property
+    def directory(self) -> str:
+        return getattr(settings, "LLM_CASSETTE_DIR", None) or os.path.join(str(getattr(settings, "BASE_DIR", ".")), "cassettes")
+
+    def mode_for(self, context) -> str:
+        return (context.cassette_mode if context is not None else None) or getattr(settings, "LLM_CASSETTE_MODE", OFF)
+
+    def cassette_for(self, context) -> Cassette:
+        name = (context.cassette if context is not None else None) or getattr(settings, "LLM_CASSETTE", "default")
+        return self.get(name)
+
+    def get(self, name: str) -> Cassette:
+        # Names come from TestRuns, so keep them to a single safe path component
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", name).lstrip(".") or "default"
+        with self._lock:
+            if name not in self._cassettes:
+                self._cassettes[name] = Cassette(os.path.join(self.directory, f"{name}.jsonl"))
+            return self._cassettes[name]
+
+    def simulate_latency(self, entry: dict):
+        """Sleep for the recorded latency scaled by LLM_CASSETTE_LATENCY; 0, the default, replays instantly"""
+        scale = getattr(settings, "LLM_CASSETTE_LATENCY", 0)
+        if scale:
+            time.sleep(entry.get("latency", 0) * scale)
+
+# Module-level singleton
+cassettes = CassetteLibrary()
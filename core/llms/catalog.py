@@ -0,0 +1,102 @@
+# llms/catalog.py
+from typing import List, Tuple
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core.models import LLMProvider, LLMModel
+import threading
+import time
+
+class LLMCatalog:
+    """
+    Process-local snapshot of the LLMProvider and LLMModel tables. Local edits
+    invalidate it through signals; edits made by other processes are picked up
+    by comparing a version stamp at most every REFRESH_INTERVAL seconds.
+    """
+    _instance = None
+    REFRESH_INTERVAL = getattr(settings, "LLM_CATALOG_REFRESH_SECONDS", 60)
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._providers = {}
+            cls._instance._models = {}
+            cls._instance._models_by_name = {}
+            cls._instance._version = None
+            cls._instance._checked_at = 0.0
+            cls._instance._stale = True
+        return cls._instance
+
+    def invalidate(self):
+        self._stale = True
+
+    def _version_stamp(self) -> Tuple:
+        providers = LLMProvider.objects.aggregate(count=Count('id'), latest=Max('date_modified'))
+        models = LLMModel.objects.aggregate(count=Count('id'), latest=Max('date_modified'))
+        return (providers['count'], providers['latest'], models['count'], models['latest'])
+
+    def _load(self, version: Tuple):
+        providers = {provider.id: provider for provider in LLMProvider.objects.all()}
+        models = {}
+        models_by_name = {}
+        for model in LLMModel.objects.all():
+            # Share the provider instance so model.provider never hits the DB
+            model.provider = providers[model.provider_id]
+            models[model.id] = model
+            models_by_name[(model.provider.name, model.model_name)] = model
+
+        self._providers = providers
+        self._models = models
+        self._models_by_name = models_by_name
+        self._version = version
+
+    def _ensure_loaded(self):
+        if not self._stale and time.monotonic() - self._checked_at < self.REFRESH_INTERVAL:
+            return
+
+        with self._lock:
+            if not self._stale and time.monotonic() - self._checked_at < self.REFRESH_INTERVAL:
+                return
+            self._stale = False
+            version = self._version_stamp()
+            if version != self._version:
+                self._load(version)
+            self._checked_at = time.monotonic()
+
+    def get_model(self, model_id: str) -> LLMModel:
+        self._ensure_loaded()
+        try:
+            return self._models[model_id]
+        except KeyError:
+            raise LLMModel.DoesNotExist(f"No LLM model with id {model_id}")
+
+    def find_model(self, provider_name: str, model_name: str, active_only: bool = True) -> LLMModel | None:
+        self._ensure_loaded()
+        model = self._models_by_name.get((provider_name, model_name))
+        if model is None or (active_only and not model.is_active):
+            return None
+        return model
+
+    def active_models(self) -> List[LLMModel]:
+        self._ensure_loaded()
+        return sorted(
+            (model for model in self._models.values() if model.is_active),
+            key=lambda model: model.date_created,
+            reverse=True
+        )
+
+    def provider_name(self, provider_id: str) -> str | None:
+        self._ensure_loaded()
+        provider = self._providers.get(provider_id)
+        return provider.name if provider is not None else None
+
+@receiver([post_save, post_delete], sender=LLMProvider)
+@receiver([post_save, post_delete], sender=LLMModel)
+def invalidate_catalog(sender, instance, **kwargs):
+    """Reload the catalog on next use after a local provider or model change."""
+    llm_catalog.invalidate()
+
+# Module-level singleton
+llm_catalog = LLMCatalog()
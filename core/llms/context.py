@@ -0,0 +1,88 @@
+# llms/context.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator
+from core.llms.tracing import Tracer
+from django.db import connection
+import threading
+
+class CallStats:
+    """Thread-safe counters collected while a test runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._usage: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, amount: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def record_call(self, model_name: str, prompt_tokens: int, completion_tokens: int, latency: float, cost: float):
+        """Add one provider call to the totals and to its model's breakdown"""
+        values = {
+            "llm_calls": 1,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "llm_latency_seconds": latency,
+            "cost": cost
+        }
+        with self._lock:
+            usage = self._usage.setdefault(model_name, {})
+            for name, amount in values.items():
+                self._counters[name] = self._counters.get(name, 0) + amount
+                usage[name] = usage.get(name, 0) + amount
+
+    def usage_by_model(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {model_name: dict(usage) for model_name, usage in self._usage.items()}
+
+@dataclass
+class LLMCallContext:
+    """Per-test settings and counters visible to every LLM call made while the test runs"""
+    # Seconds a cached response stays valid, None for the cache default
+    cache_ttl: int | None = None
+    cache_bypass: bool = False
+    # Reuse cached responses only if stored within this many seconds, used by recurring runs
+    cache_max_age: int | None = None
+    # Test the calls are made for, used to label metrics
+    test_name: str | None = None
+    stats: CallStats = field(default_factory=CallStats)
+    # Record/replay mode and cassette name, see core.llms.cassette; None uses the settings
+    cassette_mode: str | None = None
+    cassette: str | None = None
+    tracer: Tracer = field(default_factory=Tracer)
+
+_current_context: ContextVar[LLMCallContext | None] = ContextVar("llm_call_context", default=None)
+
+def current_context() -> LLMCallContext | None:
+    return _current_context.get()
+
+@contextmanager
+def call_context(**kwargs) -> Iterator[LLMCallContext]:
+    """Make an LLMCallContext current for the duration of the block"""
+    context = LLMCallContext(**kwargs)
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+@contextmanager
+def count_db_queries(stats: CallStats) -> Iterator[None]:
+    """Count the queries this thread makes during the block into stats["db_queries"]"""
+    def count(execute, sql, params, many, context):
+        stats.incr("db_queries")
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        yield
@@ -1,8 +1,36 @@
 # llms/factory.py
+from typing import Dict
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from .registry import provider_registry
 from .adapters.base import BaseLLM
-from core.models import LLMModel
+from .catalog import llm_catalog
+from core.models import LLMModel, LLMProvider
+
+# Adapter instances keyed by LLMModel id; adapters are stateless apart from
+# their model so a single instance can be shared between threads
+_adapter_cache: Dict[str, BaseLLM] = {}
 
 def get_llm(model: LLMModel) -> BaseLLM:
-    adapter_class = provider_registry.get_adapter(model.provider.name)
-    return adapter_class(model=model)
+    cached = _adapter_cache.get(model.id)
+    # A newer copy of the row than the cached one means it was edited elsewhere
+    if cached is not None and cached.model.date_modified == model.date_modified:
+        return cached
+
+    provider_name = llm_catalog.provider_name(model.provider_id) or model.provider.name
+    adapter_class = provider_registry.get_adapter(provider_name)
+    adapter = adapter_class(model=model)
+    _adapter_cache[model.id] = adapter
+    return adapter
+
+@receiver([post_save, post_delete], sender=LLMModel)
+def invalidate_cached_adapter(sender, instance, **kwargs):
+    """Drop the cached adapter when its model row changes."""
+    _adapter_cache.pop(instance.id, None)
+
+@receiver([post_save, post_delete], sender=LLMProvider)
+def invalidate_provider_adapters(sender, instance, **kwargs):
+    """A provider rename can change which adapter class a model resolves to."""
+    for model_id, adapter in list(_adapter_cache.items()):
+        if adapter.model.provider_id == instance.id:
+            _adapter_cache.pop(model_id, None)
@@ -0,0 +1,153 @@
+# llms/keyphrases.py
+from bisect import bisect_left
+from collections import Counter
+from typing import Iterable, List, Set, Tuple
+import math
+import re
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each either etc even ever every few for from further get gets had has
+have having he her here hers herself him himself his how however i if in into is it its itself just like make makes
+many may me might more most much must my myself need no nor not now of off often on once one only or other our ours
+ourselves out over own per please rather really same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up upon us use used uses using very via want
+was we well were what when where whether which while who whom whose why will with within without would yes yet you
+your yours yourself yourselves
+best better good great top option options solution solutions tool tools platform platforms product products
+offer offers offering provide provides providing give gives include includes including allow allows help helps
+let lets come comes known based focus focuses focused look looking consider considering recommend recommended
+""".split())
+
+TOKEN = re.compile(r"[^\W_][\w'+\-]*")
+# Sentence ends are followed by whitespace, unlike the dots in PhotoAI.com or 2.5
+SENTENCE_END = re.compile(r"[.!?]\s|\n")
+
+def _tokens(folded: str) -> List[Tuple[str, int, int, bool]]:
+    """Tokens as (word, start, end, follows_punctuation) over case-folded text"""
+    tokens = []
+    last_end = 0
+    for match in TOKEN.finditer(folded):
+        gap = folded[last_end:match.start()]
+        tokens.append((match.group().strip("'-"), match.start(), match.end(), bool(gap.strip())))
+        last_end = match.end()
+    return tokens
+
+def _sentences(folded: str, tokens: List[Tuple[str, int, int, bool]]) -> List[int]:
+    """Sentence number of each token"""
+    sentences = []
+    sentence = 0
+    last_end = 0
+    for _, start, end, _ in tokens:
+        if SENTENCE_END.search(folded[last_end:start]):
+            sentence += 1
+        sentences.append(sentence)
+        last_end = end
+    return sentences
+
+def _candidates(tokens: List[Tuple[str, int, int, bool]], mentions: List[Tuple[int, int, str]], max_words: int) -> List[Tuple[Tuple[str, ...], int, int]]:
+    """
+    RAKE-style candidate phrases as (words, first_token, last_token): runs of
+    words split at stopwords, punctuation, numbers and mentions, expanded
+    into every n-gram of up to max_words.
+    """
+    runs, run = [], []
+    mention_index = 0
+    for index, (word, start, end, follows_punctuation) in enumerate(tokens):
+        while mention_index < len(mentions) and mentions[mention_index][1] <= start:
+            mention_index += 1
+        in_mention = mention_index < len(mentions) and mentions[mention_index][0] < end
+        if follows_punctuation or in_mention or word in STOPWORDS or word.isdigit() or len(word) < 2:
+            if run:
+                runs.append(run)
+            run = []
+            if in_mention or word in STOPWORDS or word.isdigit() or len(word) < 2:
+                continue
+        run.append((word, index))
+    if run:
+        runs.append(run)
+
+    candidates = []
+    for run in runs:
+        for size in range(1, max_words + 1):
+            for offset in range(len(run) - size + 1):
+                words = run[offset:offset + size]
+                candidates.append((tuple(word for word, _ in words), words[0][1], words[-1][1]))
+    return candidates
+
+def _mention_token_ranges(tokens: List[Tuple[str, int, int, bool]], mentions: List[Tuple[int, int, str]], names: Set[str]) -> List[Tuple[int, int, bool]]:
+    """Token index ranges covered by every mention, with whether it is a mention of names"""
+    starts = [start for _, start, _, _ in tokens]
+    return [
+        (bisect_left(starts, start), bisect_left(starts, end) - 1, name in names)
+        for start, end, name in mentions
+    ]
+
+def _near_names(first: int, last: int, ranges: List[Tuple[int, int, bool]], sentences: List[int], window: int) -> bool:
+    """
+    Whether the nearest mention to a phrase, within window tokens, is one of
+    names. Mentions in the phrase's own sentence are nearer than any other;
+    ties count for both.
+    """
+    nearest, of_names = None, False
+    for mention_first, mention_last, is_name in ranges:
+        gap = max(0, mention_first - last, first - mention_last)
+        if gap > window:
+            continue
+        distance = (sentences[mention_first] != sentences[first], gap)
+        if nearest is None or distance < nearest:
+            nearest, of_names = distance, is_name
+        elif distance == nearest:
+            of_names = of_names or is_name
+    return of_names
+
+def extract_keyphrases(
+    texts: Iterable[str],
+    mentions: List[List[Tuple[int, int, str]]],
+    names: Iterable[str],
+    window: int = 12,
+    max_words: int = 3,
+    top_n: int = 10
+) -> List[str]:
+    """
+    Keyphrases used near mentions of names, ranked by TF-IDF: term frequency
+    within window tokens of a mention, inverse document frequency across all
+    texts. mentions holds MentionMatcher.matches for each text. A phrase is
+    attributed to its nearest mention, so text about another name close by
+    doesn't count. Shorter phrases contained in a better-ranked phrase are dropped.
+    """
+    names = set(names)
+    frequency = Counter()
+    document_frequency = Counter()
+    documents = 0
+    for text, text_mentions in zip(texts, mentions):
+        documents += 1
+        folded = text.casefold()
+        tokens = _tokens(folded)
+        candidates = _candidates(tokens, text_mentions, max_words)
+        document_frequency.update({words for words, _, _ in candidates})
+
+        ranges = _mention_token_ranges(tokens, text_mentions, names)
+        if not any(is_name for _, _, is_name in ranges):
+            continue
+        sentences = _sentences(folded, tokens)
+        for words, first, last in candidates:
+            if _near_names(first, last, ranges, sentences, window):
+                frequency[words] += 1
+
+    scores = {
+        words: count * (math.log((1 + documents) / (1 + document_frequency[words])) + 1) * math.sqrt(len(words))
+        for words, count in frequency.items()
+        # Single occurrences of multi-word runs are usually incidental
+        if count > 1 or len(words) == 1
+    }
+
+    selected = []
+    for words in sorted(scores, key=lambda words: (-scores[words], words)):
+        phrase = " ".join(words)
+        if any(f" {phrase} " in f" {kept} " for kept in selected):
+            continue
+        selected.append(phrase)
+        if len(selected) == top_n:
+            break
+    return selected
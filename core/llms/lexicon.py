@@ -0,0 +1,107 @@
+# llms/lexicon.py
+from typing import Dict
+import re
+
+# Word polarity weights, tuned for product opinions
+LEXICON: Dict[str, float] = {
+    # Positive
+    "excellent": 3.0, "outstanding": 3.0, "exceptional": 3.0, "amazing": 3.0, "fantastic": 3.0, "superb": 3.0,
+    "love": 3.0, "loved": 3.0, "loves": 3.0, "best": 2.5, "impressive": 2.5, "great": 2.5,
+    "recommend": 2.0, "recommended": 2.0, "praise": 2.0, "praised": 2.0, "popular": 1.5, "reliable": 2.0,
+    "good": 1.5, "helpful": 1.5, "useful": 1.5, "easy": 1.5, "intuitive": 2.0, "fast": 1.0, "quick": 1.0,
+    "efficient": 1.5, "effective": 1.5, "powerful": 1.5, "robust": 1.5, "seamless": 2.0, "smooth": 1.5,
+    "affordable": 1.5, "valuable": 1.5, "satisfied": 2.0, "happy": 2.0, "pleased": 2.0, "enjoy": 2.0,
+    "positive": 1.5, "strong": 1.0, "strength": 1.0, "strengths": 1.0, "advantage": 1.0, "advantages": 1.0,
+    "benefit": 1.0, "benefits": 1.0, "innovative": 1.5, "realistic": 1.0, "accurate": 1.5, "convenient": 1.5,
+    "favorable": 1.5, "trusted": 1.5, "responsive": 1.0, "solid": 1.0, "worth": 1.0, "quality": 0.5,
+    "professional": 0.5, "appreciate": 1.5, "appreciated": 1.5, "well-designed": 2.0, "user-friendly": 2.0,
+    # Negative
+    "terrible": -3.0, "awful": -3.0, "horrible": -3.0, "worst": -3.0, "hate": -3.0, "scam": -3.0, "useless": -2.5,
+    "poor": -2.0, "bad": -2.0, "disappointing": -2.5, "disappointed": -2.5, "frustrating": -2.5, "frustrated": -2.5,
+    "unreliable": -2.5, "broken": -2.0, "buggy": -2.0, "bug": -1.0, "bugs": -1.0, "glitch": -1.5, "glitches": -1.5,
+    "slow": -1.5, "expensive": -1.5, "overpriced": -2.0, "costly": -1.5, "difficult": -1.5, "confusing": -1.5,
+    "complicated": -1.5, "limited": -1.0, "lacking": -1.5, "lacks": -1.5, "issue": -1.0, "issues": -1.0,
+    "problem": -1.0, "problems": -1.0, "complaint": -1.5, "complaints": -1.5, "concern": -1.0, "concerns": -1.0,
+    "drawback": -1.0, "drawbacks": -1.0, "downside": -1.0, "downsides": -1.0, "weakness": -1.0, "weaknesses": -1.0,
+    "inconsistent": -1.5, "inaccurate": -2.0, "unrealistic": -1.5, "negative": -1.5, "fail": -2.0, "fails": -2.0,
+    "failed": -2.0, "crash": -2.0, "crashes": -2.0, "unhappy": -2.0, "dissatisfied": -2.0, "mediocre": -1.5,
+    "lag": -1.0, "outdated": -1.5, "clunky": -1.5, "misleading": -2.0, "refund": -1.0, "avoid": -2.0,
+}
+
+NEGATIONS = frozenset("not no never none nothing neither nor cannot without hardly barely isn't aren't wasn't weren't "
+                      "don't doesn't didn't won't wouldn't can't couldn't shouldn't lack".split())
+INTENSIFIERS = {"very": 1.3, "extremely": 1.5, "really": 1.2, "incredibly": 1.5, "highly": 1.3, "truly": 1.2, "super": 1.3, "so": 1.2}
+DAMPENERS = {"somewhat": 0.6, "slightly": 0.5, "fairly": 0.8, "relatively": 0.8, "quite": 0.9, "bit": 0.6, "occasionally": 0.6}
+# Praise that a negation followed by "enough" emphasizes rather than flips, e.g. "can't recommend it enough"
+EMPHATIC = frozenset(("recommend", "praise", "love", "thank", "appreciate"))
+# Words after which the rest of the sentence outweighs what came before it
+CONTRASTS = frozenset(("but", "however", "although", "though", "yet"))
+
+# Tokens considered when looking back for a negation
+NEGATION_SCOPE = 3
+# Sentiment weight at which confidence reaches one half
+EVIDENCE_HALF = 2.0
+
+TOKEN = re.compile(r"[a-z]+(?:[-'][a-z]+)*|[.!?;]")
+
+def score_sentiment(text: str) -> dict:
+    """
+    Classify text with the lexicon, flipping words within NEGATION_SCOPE of a
+    negation and scaling them by a preceding intensifier or dampener. The
+    confidence grows with the weight of evidence and how one-sided it is;
+    mixed or sentiment-free text gets a low confidence.
+    """
+    positive = negative = 0.0
+    clause = []
+    for token in TOKEN.findall(text.lower()) + ["."]:
+        if token in ".!?;":
+            positive_clause, negative_clause = _score_clause(clause)
+            positive += positive_clause
+            negative += negative_clause
+            clause = []
+        else:
+            clause.append(token)
+
+    evidence = positive + negative
+    if evidence == 0:
+        return {"sentiment": "neutral", "confidence": 0.0, "explanation": "No sentiment-bearing words", "score": 0.0}
+
+    polarity = (positive - negative) / evidence
+    strength = evidence / (evidence + EVIDENCE_HALF)
+    if abs(polarity) < 0.2:
+        sentiment = "neutral"
+        confidence = (1 - abs(polarity) * 5) * strength * 0.5
+    else:
+        sentiment = "positive" if polarity > 0 else "negative"
+        confidence = abs(polarity) * strength
+
+    return {
+        "sentiment": sentiment,
+        "confidence": round(confidence, 3),
+        "explanation": f"Lexicon weights: {positive:.1f} positive, {negative:.1f} negative",
+        "score": round(polarity, 3)
+    }
+
+def _score_clause(tokens: list) -> tuple[float, float]:
+    """Positive and negative weight of one sentence"""
+    positive = negative = 0.0
+    # Weight before and after the last contrast word, e.g. "good, but slow"
+    contrast = max((i for i, token in enumerate(tokens) if token in CONTRASTS), default=None)
+    for i, token in enumerate(tokens):
+        weight = LEXICON.get(token)
+        if weight is None:
+            continue
+        if i > 0:
+            weight *= INTENSIFIERS.get(tokens[i - 1], 1.0) * DAMPENERS.get(tokens[i - 1], 1.0)
+        if any(tokens[j] in NEGATIONS for j in range(max(0, i - NEGATION_SCOPE), i)):
+            if token in EMPHATIC and "enough" in tokens[i + 1:i + 2 + NEGATION_SCOPE]:
+                weight *= 1.5
+            else:
+                weight *= -0.75
+        if contrast is not None:
+            weight *= 0.5 if i < contrast else 1.5
+        if weight > 0:
+            positive += weight
+        else:
+            negative -= weight
+    return positive, negative
@@ -0,0 +1,102 @@
+# llms/mentions.py
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Tuple
+import re
+
+# Suffixes dropped to get the brand name from a domain, e.g. PhotoAI.com -> PhotoAI
+DOMAIN_SUFFIX = re.compile(r"\.(com|ai|io|app|co|net|org|dev|so|me|xyz)(\.[a-z]{2})?$", re.IGNORECASE)
+# A word followed by a trailing acronym, e.g. PhotoAI -> Photo AI. Names split into ordinary
+# words, like BetterPic or LinkedIn, aren't split: "a better pic" is not a mention.
+TRAILING_ACRONYM = re.compile(r"^([A-Za-z]*[a-z])([A-Z]{2,})$")
+
+def build_aliases(name: str) -> List[str]:
+    """
+    Spellings that count as a mention of name: itself, without a domain suffix,
+    with a trailing acronym split off, and without spaces
+    """
+    name = " ".join(name.split())
+    aliases = {name}
+    bare = DOMAIN_SUFFIX.sub("", name)
+    if bare:
+        aliases.add(bare)
+        aliases.add(TRAILING_ACRONYM.sub(r"\1 \2", bare))
+    for alias in list(aliases):
+        if " " in alias:
+            aliases.add(alias.replace(" ", ""))
+    return sorted(alias for alias in aliases if alias)
+
+class MentionMatcher:
+    """
+    Aho-Corasick automaton over case-folded aliases, counting whole-word
+    mentions of every name in a single pass over each text. Where matches
+    overlap, the leftmost longest wins, so "PhotoAI.com" is one mention.
+    """
+
+    def __init__(self, names: Dict[str, Iterable[str]]):
+        # Trie transitions, failure links and (alias length, name) outputs per state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, str]]] = [[]]
+        self.names = list(names)
+
+        for name, aliases in names.items():
+            for alias in aliases:
+                self._add(alias.casefold(), name)
+        self._link()
+
+    def _add(self, pattern: str, name: str):
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), name))
+
+    def _link(self):
+        """Breadth-first pass setting failure links and merging outputs along them"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def matches(self, text: str) -> List[Tuple[int, int, str]]:
+        """Non-overlapping whole-word mentions as (start, end, name) offsets into the case-folded text"""
+        folded = text.casefold()
+        found = []
+        state = 0
+        for index, char in enumerate(folded):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, name in self._output[state]:
+                start, end = index - length + 1, index + 1
+                if (start == 0 or not folded[start - 1].isalnum()) and (end == len(folded) or not folded[end].isalnum()):
+                    found.append((start, end, name))
+
+        found.sort(key=lambda match: (match[0], match[0] - match[1]))
+        selected = []
+        last_end = 0
+        for start, end, name in found:
+            if start >= last_end:
+                selected.append((start, end, name))
+                last_end = end
+        return selected
+
+    def count(self, text: str) -> Counter:
+        return Counter(name for _, _, name in self.matches(text))
+
+    def count_all(self, texts: Iterable[str]) -> List[Counter]:
+        return [self.count(text) for text in texts]
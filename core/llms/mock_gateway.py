@@ -0,0 +1,224 @@
+# llms/mock_gateway.py
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+import itertools
+import json
+import random
+import threading
+import time
+
+WORDS = (
+    "quality price support design reliable popular fast simple secure affordable "
+    "feature platform customers reviews brand market leading option alternative users"
+).split()
+
+@dataclass
+class MockGatewayConfig:
+    # Latency of each response in seconds: "fixed" uses latency, "uniform" latency ± jitter, "lognormal" a long tail around latency
+    latency: float = 0.5
+    jitter: float = 0.2
+    distribution: str = "lognormal"
+    # Fractions of requests answered with a 500 or a 429
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: int = 1
+    # Canned answers, {"match": substring of the prompt, "content": answer}; unmatched prompts get synthetic answers
+    responses: List[dict] = field(default_factory=list)
+    # Words per synthetic text answer
+    answer_words: int = 150
+    seed: int | None = None
+
+class MockGateway:
+    """
+    A local stand-in for the Cloudflare AI Gateway universal endpoint, for
+    benchmarks and offline development. Point settings.LLM_GATEWAY_URL at it.
+    Requests are answered from the first entry of the fallback array.
+    """
+
+    def __init__(self, config: MockGatewayConfig | None = None):
+        self.config = config or MockGatewayConfig()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.requests = 0
+
+    def latency(self) -> float:
+        config = self.config
+        with self._lock:
+            if config.distribution == "fixed":
+                return config.latency
+            if config.distribution == "uniform":
+                return max(0.0, self._random.uniform(config.latency - config.jitter, config.latency + config.jitter))
+            # Median of latency, with jitter as the spread of the underlying normal
+            return self._random.lognormvariate(0, config.jitter) * config.latency
+
+    def roll(self) -> float:
+        with self._lock:
+            self.requests += 1
+            return self._random.random()
+
+    def handle(self, payload) -> tuple[int, dict, dict]:
+        """Return the status, headers and body for one gateway request"""
+        if isinstance(payload, dict):
+            payload = [payload]
+        if not payload or "query" not in payload[0]:
+            return 400, {}, {"error": "Expected a universal endpoint array"}
+
+        roll = self.roll()
+        if roll < self.config.rate_limit_rate:
+            return 429, {"Retry-After": str(self.config.retry_after)}, {"error": {"message": "Rate limit reached", "type": "requests"}}
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            return 500, {}, {"error": {"message": "The server had an error processing your request", "type": "server_error"}}
+
+        return 200, {}, self.completion(payload[0]["query"])
+
+    def completion(self, query: dict) -> dict:
+        prompt = " ".join(str(message.get("content", "")) for message in query.get("messages", []))
+        content = self.content(prompt, query.get("response_format"))
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        # The gateway tags structured requests, which process_response relies on to parse JSON
+        if query.get("response_format"):
+            usage["system_tags"] = ["response_format"]
+        return {
+            "id": f"chatcmpl-mock-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": query.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }
+
+    def content(self, prompt: str, response_format: dict | None) -> str:
+        for canned in self.config.responses:
+            if canned.get("match", "") in prompt:
+                content = canned["content"]
+                return content if isinstance(content, str) else json.dumps(content)
+
+        schema = self.response_schema(response_format)
+        if schema is not None:
+            return json.dumps(self.synthesize(schema, schema.get("$defs", {})))
+
+        with self._lock:
+            return " ".join(self._random.choice(WORDS) for _ in range(self.config.answer_words)).capitalize() + "."
+
+    @staticmethod
+    def response_schema(response_format: dict | None) -> dict | None:
+        """
+        The JSON schema a response_format asks for: either OpenAI's json_schema
+        wrapper or a bare schema, as the tests send from to_strict_json_schema
+        """
+        if not response_format:
+            return None
+        if response_format.get("type") == "json_schema":
+            return response_format["json_schema"]["schema"]
+        if response_format.get("type") == "json_object":
+            return {"type": "object", "properties": {}}
+        if "properties" in response_format or response_format.get("type") == "object":
+            return response_format
+        return None
+
+    def synthesize(self, schema: dict, definitions: dict):
+        """Generate a value matching a strict JSON schema"""
+        if "$ref" in schema:
+            return self.synthesize(definitions[schema["$ref"].split("/")[-1]], definitions)
+        if "anyOf" in schema:
+            return self.synthesize(schema["anyOf"][0], definitions)
+        with self._lock:
+            if "enum" in schema:
+                return self._random.choice(schema["enum"])
+            count = self._random.randint(1, 3)
+            number = round(self._random.random(), 2)
+            word = self._random.choice(WORDS)
+
+        schema_type = schema.get("type")
+        if isinstance(schema_type, list):
+            schema_type = next((t for t in schema_type if t != "null"), "null")
+        if schema_type == "object":
+            return {name: self.synthesize(prop, definitions) for name, prop in schema.get("properties", {}).items()}
+        if schema_type == "array":
+            return [self.synthesize(schema.get("items", {}), definitions) for _ in range(count)]
+        if schema_type == "integer":
+            return count
+        if schema_type == "number":
+            return number
+        if schema_type == "boolean":
+            return number >= 0.5
+        if schema_type == "null":
+            return None
+        return word
+
+    def stream_chunks(self, completion: dict) -> List[dict]:
+        """Split a completion into chat.completion.chunk events, ending with a usage-only chunk"""
+        content = completion["choices"][0]["message"]["content"]
+        base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+        chunks = [
+            dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            for piece in pieces
+        ]
+        chunks.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        chunks.append(dict(base, choices=[], usage=completion["usage"]))
+        return chunks
+
+    def serve(self, host: str = "127.0.0.1", port: int = 8787) -> ThreadingHTTPServer:
+        """Create the HTTP server; call serve_forever on it, or use start for a background thread"""
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+                except ValueError:
+                    return self.send_json(400, {}, {"error": "Invalid JSON"})
+
+                status, headers, body = gateway.handle(payload)
+                time.sleep(gateway.latency())
+                stream = status == 200 and isinstance(payload, list) and payload[0]["query"].get("stream")
+                if stream:
+                    return self.send_stream(gateway.stream_chunks(body))
+                self.send_json(status, headers, body)
+
+            def send_json(self, status: int, headers: dict, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_stream(self, chunks: List[dict]):
+                events = [f"data: {json.dumps(chunk)}\n\n" for chunk in chunks] + ["data: [DONE]\n\n"]
+                data = "".join(events).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        return server
+
+    def start(self, host: str = "127.0.0.1", port: int = 8787) -> ThreadingHTTPServer:
+        """Serve from a daemon thread and return the server, for shutdown()"""
+        server = self.serve(host, port)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,150 @@
+# llms/ratelimit.py
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+from django.conf import settings
+from django.db import transaction, DatabaseError
+from django.utils import timezone
+from core.models import LLMModel, RateLimitBucket
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class RateLimitExceededError(Exception):
+    """Raised instead of waiting when capacity would take longer than LLM_RATE_LIMIT_MAX_WAIT to refill"""
+    pass
+
+# A bucket reservation: (key, amount, capacity, refill_per_second)
+Reservation = Tuple[str, float, float, float]
+
+class RateLimitBackend(ABC):
+    """
+    Token buckets that hand out reservations: the amount is always taken, the
+    level may go negative, and the caller waits until it would have refilled.
+    This keeps requests in arrival order without polling.
+    """
+
+    @abstractmethod
+    def reserve(self, reservations: List[Reservation], max_wait: float | None = None) -> float:
+        """
+        Take from every bucket at once and return the seconds to wait before using
+        them. If that wait exceeds max_wait, nothing is taken and the wait is returned.
+        """
+        pass
+
+    @staticmethod
+    def _take(level: float, elapsed: float, amount: float, capacity: float, refill_per_second: float) -> Tuple[float, float]:
+        level = min(capacity, level + elapsed * refill_per_second) - amount
+        wait = -level / refill_per_second if level < 0 else 0.0
+        return level, wait
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """In-memory buckets for a single process"""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, reservations: List[Reservation], max_wait: float | None = None) -> float:
+        with self._lock:
+            now = time.monotonic()
+            levels = {}
+            wait = 0.0
+            for key, amount, capacity, refill_per_second in reservations:
+                level, updated = self._buckets.get(key, (capacity, now))
+                levels[key], bucket_wait = self._take(level, now - updated, amount, capacity, refill_per_second)
+                wait = max(wait, bucket_wait)
+            if max_wait is None or wait <= max_wait:
+                self._buckets.update((key, (level, now)) for key, level in levels.items())
+            return wait
+
+class DatabaseRateLimitBackend(RateLimitBackend):
+    """
+    Buckets stored in RateLimitBucket rows, all of a reservation's rows locked
+    by one SELECT FOR UPDATE so every worker on every node shares them. Falls
+    back to process-local buckets while the database is unreachable.
+    """
+
+    def __init__(self):
+        self._fallback = LocalRateLimitBackend()
+
+    def reserve(self, reservations: List[Reservation], max_wait: float | None = None) -> float:
+        try:
+            return self._reserve(reservations, max_wait)
+        except DatabaseError:
+            logger.warning("Shared rate limit buckets unavailable, using local buckets", exc_info=True)
+            return self._fallback.reserve(reservations, max_wait)
+
+    def _reserve(self, reservations: List[Reservation], max_wait: float | None) -> float:
+        keys = [key for key, _, _, _ in reservations]
+        with transaction.atomic():
+            # Locking in key order keeps concurrent reservations of the same buckets from deadlocking
+            buckets = {bucket.key: bucket for bucket in RateLimitBucket.objects.select_for_update().filter(key__in=keys).order_by("key")}
+            if len(buckets) < len(keys):
+                RateLimitBucket.objects.bulk_create([
+                    RateLimitBucket(key=key, level=capacity)
+                    for key, _, capacity, _ in reservations
+                    if key not in buckets
+                ], ignore_conflicts=True)
+                buckets = {bucket.key: bucket for bucket in RateLimitBucket.objects.select_for_update().filter(key__in=keys).order_by("key")}
+
+            now = timezone.now()
+            wait = 0.0
+            for key, amount, capacity, refill_per_second in reservations:
+                bucket = buckets[key]
+                elapsed = max(0.0, (now - bucket.date_modified).total_seconds())
+                bucket.level, bucket_wait = self._take(bucket.level, elapsed, amount, capacity, refill_per_second)
+                bucket.date_modified = now
+                wait = max(wait, bucket_wait)
+            if max_wait is None or wait <= max_wait:
+                RateLimitBucket.objects.bulk_update(buckets.values(), ["level", "date_modified"])
+            return wait
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits per provider/model, taken from LLMModel"""
+    BACKENDS = {
+        "local": LocalRateLimitBackend,
+        "database": DatabaseRateLimitBackend,
+    }
+    # Completion tokens assumed for queries that don't set max_tokens
+    COMPLETION_ESTIMATE = getattr(settings, "LLM_RATE_LIMIT_COMPLETION_ESTIMATE", 500)
+    # Longest acceptable wait for capacity in seconds, None to wait however long it takes
+    MAX_WAIT = getattr(settings, "LLM_RATE_LIMIT_MAX_WAIT", 120)
+
+    def __init__(self):
+        self.backend = self.BACKENDS[getattr(settings, "LLM_RATE_LIMIT_BACKEND", "database")]()
+
+    @classmethod
+    def estimate_tokens(cls, query: dict) -> int:
+        """Rough token count for a chat query: ~4 characters per prompt token plus the expected completion"""
+        prompt_chars = sum(
+            len(message.get("content") or "") if isinstance(message.get("content"), str) else 0
+            for message in query.get("messages", [])
+        )
+        return prompt_chars // 4 + (query.get("max_tokens") or query.get("max_completion_tokens") or cls.COMPLETION_ESTIMATE)
+
+    def acquire(self, provider_name: str, model: LLMModel, query: dict) -> float:
+        """
+        Block until the model has capacity for the query and return the seconds spent
+        waiting. Raises RateLimitExceededError, without taking any capacity, when the
+        wait would exceed LLM_RATE_LIMIT_MAX_WAIT seconds.
+        """
+        key = f"{provider_name}:{model.model_name}"
+        reservations = []
+        if model.requests_per_minute:
+            reservations.append((f"rpm:{key}", 1, model.requests_per_minute, model.requests_per_minute / 60))
+        if model.tokens_per_minute:
+            reservations.append((f"tpm:{key}", self.estimate_tokens(query), model.tokens_per_minute, model.tokens_per_minute / 60))
+        if not reservations:
+            return 0.0
+
+        wait = self.backend.reserve(reservations, self.MAX_WAIT)
+        if self.MAX_WAIT is not None and wait > self.MAX_WAIT:
+            raise RateLimitExceededError(f"Rate limit for {key} would need a {wait:.1f}s wait, over the {self.MAX_WAIT}s maximum")
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+# Module-level singleton
+rate_limiter = RateLimiter()
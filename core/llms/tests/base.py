@@ -1,9 +1,10 @@
 from abc import ABC, abstractmethod
 from typing import Type, List, Any, Optional
 from dataclasses import dataclass
+from django.conf import settings
 from core.llms.adapters.base import BaseLLM
 from core.llms.factory import get_llm
-from core.models import LLMModel, LLMProvider
+from core.llms.catalog import llm_catalog
 
 @dataclass
 class TestResult:
@@ -21,18 +22,33 @@ class TestResult:
 class BaseLLMTest(ABC):
     # Define as class variable that will be overridden by subclasses
     required_capabilities: List[str] = []
+    # Seconds the responses of this test's LLM calls may be served from cache
+    cache_ttl: int = getattr(settings, "LLM_CACHE_TTL", 24 * 60 * 60)
 
     @staticmethod
     def get_analysis_llm() -> BaseLLM:
         """Get the designated LLM for analysis operations"""
-        provider = LLMProvider.objects.get(name="OpenAI")
-        model = LLMModel.objects.filter(
-            provider=provider,
-            model_name="chatgpt-4o-latest",
-            is_active=True
-        ).first()
+        model = llm_catalog.find_model("OpenAI", "chatgpt-4o-latest")
         return get_llm(model)
 
+    @classmethod
+    def get_cache_ttl(cls) -> int:
+        """Cache TTL for this test, overridable per test name with settings.LLM_CACHE_TTLS"""
+        return getattr(settings, "LLM_CACHE_TTLS", {}).get(cls.test_name(), cls.cache_ttl)
+
+    @staticmethod
+    def query_prompts(llm: BaseLLM, prompts: List[str]) -> List[Any]:
+        """Send independent single-message prompts concurrently and return the processed responses in order"""
+        queries = [{"messages": [{"role": "user", "content": prompt}]} for prompt in prompts]
+        results = llm.query_many(queries)
+
+        # Keep the sequential behaviour of failing the test on the first error
+        for result in results:
+            if not result.success:
+                raise result.error
+
+        return [llm.process_response(result.response) for result in results]
+
     @classmethod
     @abstractmethod
     def test_name(cls) -> str:
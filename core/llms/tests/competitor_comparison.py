@@ -3,6 +3,12 @@ from .base import BaseLLMTest, TestResult
 from core.llms.adapters.base import BaseLLM
 from pydantic import BaseModel
 from django.conf import settings
+from openai.lib._pydantic import to_strict_json_schema
+import json
+
+class CompetitorSummaryResponse(BaseModel):
+    summary: str
+    answer_summaries: List[str]
 
 class CompetitorComparisonTest(BaseLLMTest):
     required_capabilities = ["chat"]
@@ -41,12 +47,7 @@ class CompetitorComparisonTest(BaseLLMTest):
             f"How does {competitor} compare to {self.product}?"
         ]
         
-        responses = []
-        for prompt in comparison_prompts:
-            query = {"messages": [{"role": "user", "content": prompt}]}
-            response = llm.query(query)
-            responses.append(llm.process_response(response))
-        
+        responses = self.query_prompts(llm, comparison_prompts)
         return responses, comparison_prompts
 
     def run(self, llm: BaseLLM) -> TestResult:
@@ -57,6 +58,7 @@ class CompetitorComparisonTest(BaseLLMTest):
             raw_responses = []
             
             analysis_llm = self.get_analysis_llm()
+            has_structured_output = "structured_output" in analysis_llm.capabilities()
             
             for competitor in competitors:
                 responses, prompts = self._get_competitor_comparison(llm, competitor)
@@ -68,17 +70,14 @@ class CompetitorComparisonTest(BaseLLMTest):
                         "response": response
                     })
                 
-                # Create a summary prompt using all responses
-                summary_prompt = f"""Based on these detailed comparisons between {self.product} and {competitor}, provide a 1-2 sentence summary highlighting only the most important parts:
-
-                Detailed comparisons:
-                {' '.join(responses)}
+                # Summarize everything in one structured request when possible
+                batched = self._get_batched_summaries(analysis_llm, competitor, prompts, responses) if has_structured_output else None
+                if batched is not None:
+                    summary, answer_summaries, summary_prompt, summary_response = batched
+                else:
+                    summary, summary_prompt, summary_response = self._get_overall_summary(analysis_llm, competitor, responses)
+                    answer_summaries = self._get_response_summaries(prompts, responses)
 
-                Summary:"""
-                
-                query = {"messages": [{"role": "user", "content": summary_prompt}]}
-                summary_response = analysis_llm.query(query)
-                summary = analysis_llm.process_response(summary_response)
                 raw_responses.append({
                     "prompt": summary_prompt,
                     "response": summary_response
@@ -94,8 +93,8 @@ class CompetitorComparisonTest(BaseLLMTest):
                         "detailed_responses": [
                             {
                                 "question": prompt,
-                                "answer": self._get_response_summary(llm, prompt, response)
-                            } for prompt, response in zip(prompts, responses)
+                                "answer": answer
+                            } for prompt, answer in zip(prompts, answer_summaries)
                         ]
                     }
                 })
@@ -117,17 +116,70 @@ class CompetitorComparisonTest(BaseLLMTest):
                 error=str(e)
             )
 
-    def _get_response_summary(self, llm: BaseLLM, prompt: str, response: str) -> str:
+    def _get_batched_summaries(self, analysis_llm: BaseLLM, competitor: str, prompts: List[str], responses: List[str]) -> tuple[str, List[str], str, dict] | None:
+        """
+        Get the overall summary and one summary per answer in a single structured
+        request. Returns None when the output doesn't match the expected shape.
+        """
+        numbered_responses = "\n\n".join(
+            f"{i}. Question: {prompt}\n   Response: {response}"
+            for i, (prompt, response) in enumerate(zip(prompts, responses), start=1)
+        )
+        summary_prompt = f"""Based on these detailed comparisons between {self.product} and {competitor}, respond with a JSON object containing:
+                - summary: a 1-2 sentence summary highlighting only the most important parts of all the comparisons
+                - answer_summaries: a list of exactly {len(prompts)} strings, one 1-2 sentence summary of each numbered response focusing on its key points, in the same order
+
+                Detailed comparisons:
+                {numbered_responses}
+                """
+
+        query = {
+            "response_format": to_strict_json_schema(CompetitorSummaryResponse),
+            "messages": [{"role": "user", "content": summary_prompt}]
+        }
+        summary_response = analysis_llm.query(query)
+        processed = analysis_llm.process_response(summary_response)
+
+        if isinstance(processed, str):
+            try:
+                processed = json.loads(processed)
+            except json.JSONDecodeError:
+                return None
+
+        if not isinstance(processed, dict):
+            return None
+        summary = processed.get("summary")
+        answer_summaries = processed.get("answer_summaries")
+        if not isinstance(summary, str) or not isinstance(answer_summaries, list) or len(answer_summaries) != len(prompts):
+            return None
+
+        return summary, answer_summaries, summary_prompt, summary_response
+
+    def _get_overall_summary(self, analysis_llm: BaseLLM, competitor: str, responses: List[str]) -> tuple[str, str, dict]:
+        # Create a summary prompt using all responses
+        summary_prompt = f"""Based on these detailed comparisons between {self.product} and {competitor}, provide a 1-2 sentence summary highlighting only the most important parts:
+
+                Detailed comparisons:
+                {' '.join(responses)}
+
+                Summary:"""
+
+        query = {"messages": [{"role": "user", "content": summary_prompt}]}
+        summary_response = analysis_llm.query(query)
+        return analysis_llm.process_response(summary_response), summary_prompt, summary_response
+
+    def _get_response_summaries(self, prompts: List[str], responses: List[str]) -> List[str]:
         analysis_llm = self.get_analysis_llm()
-        summary_prompt = f"""Summarize this response in 1-2 sentences, focusing on the key points:
+        summary_prompts = [
+            f"""Summarize this response in 1-2 sentences, focusing on the key points:
 
         Question: {prompt}
         Response: {response}
 
         Summary:"""
-        
-        query = {"messages": [{"role": "user", "content": summary_prompt}]}
-        return analysis_llm.process_response(analysis_llm.query(query))
+            for prompt, response in zip(prompts, responses)
+        ]
+        return self.query_prompts(analysis_llm, summary_prompts)
 
 # from core.models import LLMModel, LLMProvider
 # from core.llms.factory import get_llm
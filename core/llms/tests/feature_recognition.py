@@ -38,15 +38,13 @@ class FeatureRecognitionTest(BaseLLMTest):
             f"What problems does {self.product} solve?"
         ]
         
-        responses = []
-        for prompt in prompts:
-            query = {"messages": [{"role": "user", "content": prompt}]}
-            response = llm.query(query)
-            responses.append({
+        return [
+            {
                 "prompt": prompt,
-                "response": llm.process_response(response)
-            })
-        return responses
+                "response": response
+            }
+            for prompt, response in zip(prompts, self.query_prompts(llm, prompts))
+        ]
 
     def run(self, llm: BaseLLM) -> TestResult:
         try:
@@ -1,17 +1,16 @@
 from typing import List
 from .base import BaseLLMTest, TestResult
 from core.llms.adapters.base import BaseLLM
+from core.llms.mentions import MentionMatcher, build_aliases
+from core.llms.keyphrases import extract_keyphrases
+from collections import Counter
 from pydantic import BaseModel
 from django.conf import settings
 from openai.lib._pydantic import to_strict_json_schema
 
 class MentionFrequencyResponse(BaseModel):
-    brand_mentions: int
-    competitor_mentions: int
     mentioned_competitors: List[str]
     analysis: str
-    brand_keywords: List[str]
-    competitor_keywords: List[str]
 
 class MentionFrequencyTest(BaseLLMTest):
     required_capabilities = ["chat"]
@@ -29,6 +28,17 @@ class MentionFrequencyTest(BaseLLMTest):
     def description(self) -> str:
         return "Analyzes how frequently a brand is mentioned compared to competitors in product category discussions"
 
+    def _distinct_competitors(self, competitors: List[str]) -> List[str]:
+        """Drop duplicates and names that are spellings of the product itself"""
+        seen = {alias.casefold() for alias in build_aliases(self.product)}
+        distinct = []
+        for competitor in competitors:
+            aliases = {alias.casefold() for alias in build_aliases(competitor)}
+            if competitor.strip() and not aliases & seen:
+                distinct.append(" ".join(competitor.split()))
+                seen |= aliases
+        return distinct
+
     def run(self, llm: BaseLLM) -> TestResult:
         try:
             # List of prompts focused on specific use cases and product description
@@ -44,29 +54,22 @@ class MentionFrequencyTest(BaseLLMTest):
             ]
 
             # Get initial responses using provided LLM
-            prompt_responses = []
-            for prompt in prompts:
-                query = {"messages": [{"role": "user", "content": prompt}]}
-                response = llm.query(query)
-                processed = llm.process_response(response)
-                prompt_responses.append({
+            prompt_responses = [
+                {
                     "prompt": prompt,
                     "response": processed
-                })
+                }
+                for prompt, processed in zip(prompts, self.query_prompts(llm, prompts))
+            ]
 
-            # Use analysis LLM for analysis
+            # The analysis LLM only discovers competitor names; mentions and keywords are computed locally
             analysis_llm = self.get_analysis_llm()
             has_structured_output = "structured_output" in analysis_llm.capabilities()
             
-            # Analysis prompt remains the same but uses analysis_llm
             if has_structured_output:
-                analysis_prompt = f"""Analyze these responses to questions about {self.product_category}. Count mentions of {self.product} versus competitor brands. Respond with a JSON object containing:
-                - brand_mentions: number of times {self.product} is mentioned
-                - competitor_mentions: total number of times other brands are mentioned
-                - mentioned_competitors: list of competitor brand names mentioned
-                - analysis: brief analysis of the brand's presence in responses
-                - brand_keywords: list of key terms/phrases associated with {self.product} in the responses (the most commonly used keywords across all of the responses)
-                - competitor_keywords: list of key terms/phrases associated with competitor products
+                analysis_prompt = f"""Analyze these responses to questions about {self.product_category}. Respond with a JSON object containing:
+                - mentioned_competitors: list of brand names other than {self.product} mentioned in the responses, each written as it appears
+                - analysis: brief analysis of {self.product}'s presence in the responses
 
                 Responses to analyze:
                 {chr(10).join(f'- {resp["response"]}' for resp in prompt_responses)}
@@ -79,9 +82,9 @@ class MentionFrequencyTest(BaseLLMTest):
                 }
             else:
                 analysis_prompt = f"""Analyze these responses about {self.product_category} and provide the following information in exactly this format:
-                [mentions of {self.product}],[total mentions of other brands],[competitor1,competitor2,etc],[brief analysis],[keyword1|keyword2|etc for {self.product} (the most commonly used keywords across all of the responses)],[keyword1|keyword2|etc for competitors (the most commonly used keywords across all of the responses)]
+                [competitor1|competitor2|etc (brands other than {self.product})],[brief analysis]
 
-                For example: 3,5,Google Pixel|Huawei Nova 13|IPhone 16,Brand has moderate presence,AI camera|portrait mode,computational photography|night mode
+                For example: Google Pixel|Huawei Nova 13|IPhone 16,Brand has moderate presence
 
                 Responses:
                 {chr(10).join(f'- {resp["response"]}' for resp in prompt_responses)}
@@ -95,45 +98,53 @@ class MentionFrequencyTest(BaseLLMTest):
             analysis_response = analysis_llm.query(query)
             processed_analysis = analysis_llm.process_response(analysis_response)
             
-            if has_structured_output:
-                readable_response = (
-                    f"Brand '{self.product}' was mentioned {processed_analysis.brand_mentions} times, "
-                    f"while competitors were mentioned {processed_analysis.competitor_mentions} times. "
-                    f"Main competitors mentioned: {', '.join(processed_analysis.mentioned_competitors)}. "
-                    f"{processed_analysis.analysis}"
-                )
+            if isinstance(processed_analysis, dict):
+                competitors = processed_analysis.get("mentioned_competitors", [])
+                analysis = processed_analysis.get("analysis", "")
             else:
-                brand_mentions, competitor_mentions, competitors_str, analysis, brand_keywords_str, competitor_keywords_str = processed_analysis.split(',', 5)
+                competitors_str, analysis = processed_analysis.split(',', 1)
                 competitors = [c.strip() for c in competitors_str.split('|') if c.strip()]
-                brand_keywords = [k.strip() for k in brand_keywords_str.split('|') if k.strip()]
-                competitor_keywords = [k.strip() for k in competitor_keywords_str.split('|') if k.strip()]
-                readable_response = (
-                    f"Brand '{self.product}' was mentioned {brand_mentions} times, "
-                    f"while competitors were mentioned {competitor_mentions} times. "
-                    f"Main competitors mentioned: {', '.join(competitors)}. "
-                    f"{analysis}"
-                )
+                analysis = analysis.strip()
+
+            competitors = self._distinct_competitors(competitors)
+            matcher = MentionMatcher({
+                self.product: build_aliases(self.product),
+                **{competitor: build_aliases(competitor) for competitor in competitors}
+            })
+            responses = [resp["response"] for resp in prompt_responses]
+            response_matches = [matcher.matches(response) for response in responses]
+            response_counts = [Counter(name for _, _, name in matches) for matches in response_matches]
+            brand_mentions = sum(counts[self.product] for counts in response_counts)
+            competitor_mentions = sum(counts[competitor] for counts in response_counts for competitor in competitors)
+
+            readable_response = (
+                f"Brand '{self.product}' was mentioned {brand_mentions} times, "
+                f"while competitors were mentioned {competitor_mentions} times. "
+                f"Main competitors mentioned: {', '.join(competitors)}. "
+                f"{analysis}"
+            )
 
             structured_data = {
                 "brand_stats": {
                     "brand_name": self.product,
-                    "mention_count": processed_analysis.brand_mentions if has_structured_output else int(brand_mentions),
-                    "competitor_mention_count": processed_analysis.competitor_mentions if has_structured_output else int(competitor_mentions),
+                    "mention_count": brand_mentions,
+                    "competitor_mention_count": competitor_mentions,
+                    # Number of responses mentioning each competitor
                     "competitors": {
-                        competitor: sum(1 for resp in prompt_responses 
-                                     if competitor.lower() in resp["response"].lower())
-                        for competitor in (processed_analysis.mentioned_competitors if has_structured_output else competitors)
+                        competitor: sum(1 for counts in response_counts if counts[competitor])
+                        for competitor in competitors
                     },
-                    "brand_keywords": processed_analysis.brand_keywords if has_structured_output else brand_keywords,
-                    "competitor_keywords": processed_analysis.competitor_keywords if has_structured_output else competitor_keywords
+                    # Phrases used near the brand's and the competitors' mentions
+                    "brand_keywords": extract_keyphrases(responses, response_matches, [self.product]),
+                    "competitor_keywords": extract_keyphrases(responses, response_matches, competitors)
                 },
                 "brand_mentions": [
                     {
                         "prompt": resp["prompt"],
                         "response": resp["response"]
                     }
-                    for resp in prompt_responses
-                    if self.product.lower() in resp["response"].lower()
+                    for resp, counts in zip(prompt_responses, response_counts)
+                    if counts[self.product]
                 ]
             }
 
@@ -8,17 +8,28 @@ class TestRegistry:
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance._tests = {}
+            # Required capabilities per test, built at registration time
+            cls._instance._requirements = {}
+            # Available tests per distinct set of model capabilities
+            cls._instance._available = {}
         return cls._instance
     
     def register(self, test_class: Type[BaseLLMTest]):
         self._tests[test_class.test_name()] = test_class
+        self._requirements[test_class.test_name()] = frozenset(test_class.required_capabilities)
+        self._available.clear()
     
     def get_available_tests(self, llm_model: LLMModel) -> List[Type[BaseLLMTest]]:
         """Get all tests that can run on this LLM based on its capabilities"""
-        available_tests = []
-        for test_name, test_class in self._tests.items():
-            if all(cap in llm_model.capabilities for cap in test_class.required_capabilities):
-                available_tests.append(test_class)
-        return available_tests
+        capabilities = frozenset(llm_model.capabilities)
+        available_tests = self._available.get(capabilities)
+        if available_tests is None:
+            available_tests = [
+                self._tests[test_name]
+                for test_name, requirements in self._requirements.items()
+                if requirements <= capabilities
+            ]
+            self._available[capabilities] = available_tests
+        return list(available_tests)
 
-test_registry = TestRegistry()
\ No newline at end of file
+test_registry = TestRegistry()
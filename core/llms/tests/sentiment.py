@@ -1,5 +1,7 @@
-from typing import List
+from typing import List, Tuple
 from openai.lib._pydantic import to_strict_json_schema
+import json
+import re
 
 from django.conf import settings
 from .base import BaseLLMTest, TestResult
@@ -11,6 +13,19 @@ class SentimentAnalysisResponse(BaseModel):
     confidence: float
     explanation: str
 
+class SentimentItem(BaseModel):
+    index: int
+    sentiment: str
+    confidence: float
+    explanation: str
+
+class BatchSentimentResponse(BaseModel):
+    results: List[SentimentItem]
+
+SENTIMENTS = ("positive", "negative", "neutral")
+# Matches "3: POSITIVE" style lines from the plain-text batch format
+SENTIMENT_LINE = re.compile(r"^\s*(\d+)\s*[:.)-]\s*(positive|negative|neutral)\b", re.IGNORECASE | re.MULTILINE)
+
 class SentimentAnalysisTest(BaseLLMTest):
     required_capabilities = ["chat"]
 
@@ -58,15 +73,18 @@ class SentimentAnalysisTest(BaseLLMTest):
             processed_response = llm.process_response(response)
 
             if has_structured_output:
+                # process_response returns the parsed JSON as a dict, or the raw text if it didn't parse
+                if not isinstance(processed_response, dict):
+                    raise ValueError(f"Expected a JSON sentiment response, got: {processed_response}")
                 readable_response = (
-                    f"The sentiment of the text is {processed_response.sentiment.lower()} "
-                    f"(confidence: {processed_response.confidence:.2f}). "
-                    f"{processed_response.explanation}"
+                    f"The sentiment of the text is {processed_response['sentiment'].lower()} "
+                    f"(confidence: {processed_response['confidence']:.2f}). "
+                    f"{processed_response['explanation']}"
                 )
                 structured_data = {
-                    "sentiment": processed_response.sentiment,
-                    "confidence": processed_response.confidence,
-                    "explanation": processed_response.explanation
+                    "sentiment": processed_response["sentiment"],
+                    "confidence": processed_response["confidence"],
+                    "explanation": processed_response["explanation"]
                 }
             else:
                 sentiment = processed_response.upper()
@@ -91,4 +109,97 @@ class SentimentAnalysisTest(BaseLLMTest):
             return TestResult(
                 success=False,
                 error=str(e)
-            )
\ No newline at end of file
+            )
+
+    @classmethod
+    def analyze_batch(cls, llm: BaseLLM, texts: List[str], max_retries: int = 1) -> Tuple[List[dict | None], List[dict]]:
+        """
+        Classify several texts in one request. Returns the per-text sentiment data
+        (None where no valid answer was parsed) and the raw responses. Only texts
+        whose answers failed to parse are re-sent on retry.
+        """
+        has_structured_output = "structured_output" in llm.capabilities()
+        results: List[dict | None] = [None] * len(texts)
+        raw_responses = []
+
+        for _ in range(max_retries + 1):
+            pending = [i for i, result in enumerate(results) if result is None]
+            if not pending:
+                break
+
+            numbered_texts = "\n\n".join(
+                f'{number}. "{texts[i]}"' for number, i in enumerate(pending, start=1)
+            )
+            if has_structured_output:
+                prompt = f"""You are a sentiment analysis expert. Analyze the sentiment of each of the following numbered texts and respond with a JSON object containing a "results" list with one entry per text:
+                - index: the number of the text
+                - sentiment: either 'positive', 'negative', or 'neutral'
+                - confidence: a float between 0 and 1
+                - explanation: a brief explanation of your reasoning
+
+                Texts to analyze:
+                {numbered_texts}
+                """
+                query = {
+                    "response_format": to_strict_json_schema(BatchSentimentResponse),
+                    "messages": [
+                        {"role": "user", "content": prompt}
+                    ]
+                }
+            else:
+                prompt = f"""You are a sentiment analysis expert. Your task is to analyze the sentiment of each of the following numbered texts. Respond with exactly one line per text in the format "<number>: <SENTIMENT>", where SENTIMENT is either POSITIVE, NEGATIVE, or NEUTRAL. Do not include any other text in your response.
+
+                Texts to analyze:
+                {numbered_texts}
+                """
+                query = {
+                    "messages": [
+                        {"role": "user", "content": prompt}
+                    ]
+                }
+
+            response = llm.query(query)
+            raw_responses.append(response)
+            processed_response = llm.process_response(response)
+
+            parsed = cls._parse_batch_response(processed_response, has_structured_output)
+            for number, sentiment_data in parsed.items():
+                if 1 <= number <= len(pending):
+                    results[pending[number - 1]] = sentiment_data
+
+        return results, raw_responses
+
+    @staticmethod
+    def _parse_batch_response(processed_response, has_structured_output: bool) -> dict:
+        """Map the 1-based text numbers in a batch answer to their sentiment data"""
+        parsed = {}
+        if has_structured_output:
+            if isinstance(processed_response, str):
+                try:
+                    processed_response = json.loads(processed_response)
+                except json.JSONDecodeError:
+                    return parsed
+
+            items = processed_response.get("results", []) if isinstance(processed_response, dict) else []
+            for item in items:
+                try:
+                    number = int(item["index"])
+                    sentiment = str(item["sentiment"])
+                    confidence = float(item["confidence"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if sentiment.lower() not in SENTIMENTS:
+                    continue
+                parsed[number] = {
+                    "sentiment": sentiment,
+                    "confidence": confidence,
+                    "explanation": item.get("explanation")
+                }
+        elif isinstance(processed_response, str):
+            for number, sentiment in SENTIMENT_LINE.findall(processed_response):
+                parsed[int(number)] = {
+                    "sentiment": sentiment.upper(),
+                    "confidence": None,
+                    "explanation": None
+                }
+        return parsed
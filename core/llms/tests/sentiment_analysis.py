@@ -2,10 +2,13 @@ from typing import List
 from .base import BaseLLMTest, TestResult
 from .sentiment import SentimentAnalysisTest
 from core.llms.adapters.base import BaseLLM
+from core.llms.lexicon import score_sentiment
 from django.conf import settings
 
 class ProductSentimentAnalysisTest(BaseLLMTest):
     required_capabilities = ["chat"]
+    # Opinions the lexicon scores below this confidence are classified by the analysis LLM
+    local_confidence_threshold: float = getattr(settings, "LLM_SENTIMENT_LOCAL_THRESHOLD", 0.7)
 
     def __init__(self, product: str, product_category: str, product_description: str):
         self.product = product
@@ -29,40 +32,55 @@ class ProductSentimentAnalysisTest(BaseLLMTest):
             f"What's your assessment of {self.product}'s strengths and weaknesses?"
         ]
         
-        opinions = []
-        for prompt in prompts:
-            query = {"messages": [{"role": "user", "content": prompt}]}
-            response = llm.query(query)
-            processed = llm.process_response(response)
-            opinions.append({
+        return [
+            {
                 "prompt": prompt,
                 "response": processed
-            })
-        return opinions
+            }
+            for prompt, processed in zip(prompts, self.query_prompts(llm, prompts))
+        ]
+
+    def _classify(self, texts: List[str]) -> tuple[List[dict | None], List[str]]:
+        """
+        Score every text with the local lexicon, then send only those below
+        local_confidence_threshold to the analysis LLM in one batch. Returns
+        the sentiments and the stage that decided each.
+        """
+        sentiments = [score_sentiment(text) for text in texts]
+        stages = ["lexicon"] * len(texts)
+        uncertain = [i for i, sentiment in enumerate(sentiments) if sentiment["confidence"] < self.local_confidence_threshold]
+        if not uncertain:
+            return sentiments, stages
+
+        llm_sentiments, _ = SentimentAnalysisTest.analyze_batch(
+            self.get_analysis_llm(),
+            [texts[i] for i in uncertain]
+        )
+        for i, sentiment in zip(uncertain, llm_sentiments):
+            # Keep the lexicon's answer when the LLM's couldn't be parsed
+            if sentiment is not None:
+                sentiments[i] = sentiment
+                stages[i] = "llm"
+        return sentiments, stages
 
     def run(self, llm: BaseLLM) -> TestResult:
         try:
             # Get opinions using the provided LLM
             opinions = self._get_product_opinions(llm)
             
-            # Use analysis LLM for sentiment analysis
-            analysis_llm = self.get_analysis_llm()
-            sentiment_analyzer = SentimentAnalysisTest("")
-            sentiment_results = []
-            
-            for opinion in opinions:
-                sentiment_analyzer.text = opinion["response"]
-                # Use analysis_llm instead of provided llm
-                sentiment_result = sentiment_analyzer.run(analysis_llm)
-                
-                if not sentiment_result.success:
-                    continue
-                    
-                sentiment_results.append({
+            sentiments, stages = self._classify([opinion["response"] for opinion in opinions])
+
+            sentiment_results = [
+                {
                     "prompt": opinion["prompt"],
                     "response": opinion["response"],
-                    "sentiment": sentiment_result.structured_data
-                })
+                    "sentiment": sentiment,
+                    # Which classifier decided this opinion: "lexicon" or "llm"
+                    "stage": stage
+                }
+                for opinion, sentiment, stage in zip(opinions, sentiments, stages)
+                if sentiment is not None
+            ]
 
             # Calculate overall sentiment stats
             total_analyzed = len(sentiment_results)
@@ -107,7 +125,11 @@ class ProductSentimentAnalysisTest(BaseLLMTest):
                 },
                 metadata={
                     "product_category": self.product_category,
-                    "total_opinions": total_analyzed
+                    "total_opinions": total_analyzed,
+                    "decided_by": {
+                        stage: sum(1 for r in sentiment_results if r["stage"] == stage)
+                        for stage in ("lexicon", "llm")
+                    }
                 }
             )
 
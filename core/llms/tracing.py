@@ -0,0 +1,72 @@
+# llms/tracing.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List
+import itertools
+import threading
+import time
+
+# Id of the innermost open span, copied into query_many threads with the rest of the context
+_current_span: ContextVar[int | None] = ContextVar("llm_current_span", default=None)
+
+class Tracer:
+    """
+    Collects the spans of one test. Spans are stored compactly as
+    [id, parent_id, name, start_ms, duration_ms, attributes] with start_ms
+    relative to the tracer's start time.
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self._started = time.monotonic()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._spans: List[list] = []
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[dict]:
+        """Record the block as a span; attributes added to the yielded dict are stored with it"""
+        span_id = next(self._ids)
+        parent_id = _current_span.get()
+        token = _current_span.set(span_id)
+        started = time.monotonic()
+        try:
+            yield attributes
+        except Exception as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            self.add(span_id, parent_id, name, started, time.monotonic() - started, attributes)
+
+    def add_span(self, name: str, start: float, duration: float, **attributes):
+        """Record a span measured elsewhere; start is a time.time() timestamp"""
+        self.add(next(self._ids), _current_span.get(), name, self._started + (start - self.start), duration, attributes)
+
+    def add(self, span_id: int, parent_id: int | None, name: str, started: float, duration: float, attributes: dict):
+        span = [
+            span_id,
+            parent_id,
+            name,
+            round((started - self._started) * 1000, 1),
+            round(duration * 1000, 1),
+            {k: v for k, v in attributes.items() if v is not None}
+        ]
+        with self._lock:
+            self._spans.append(span)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"start": self.start, "spans": sorted(self._spans, key=lambda span: (span[3], span[0]))}
+
+@contextmanager
+def trace_span(name: str, **attributes) -> Iterator[dict]:
+    """Record a span on the current test's tracer; a no-op outside a call context"""
+    from core.llms.context import current_context
+
+    context = current_context()
+    if context is None:
+        yield attributes
+        return
+    with context.tracer.span(name, **attributes) as span:
+        yield span
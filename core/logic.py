@@ -1,49 +1,252 @@
-from django.db import transaction
-from django_q.tasks import async_task
+from typing import List, Tuple, Type
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction, connection
+from django_q.brokers import get_broker
 from django_q.models import Task
-from django.db.models import F
-from .models import TestRun, LLMModel, Profile
+from django.db.models import F, Count, Sum
+from .models import TestRun, TestResult, TestBatch, RecurringRun, LLMModel, Profile
+from .llms.tests.base import BaseLLMTest
 from .llms.tests.registry import test_registry
+from .llms.catalog import llm_catalog
+from .tasks.bulk import bulk_async_task
+from .metrics import metrics, TEST_RUNS_INITIATED, TASKS_ENQUEUED, INITIATE_DURATION
+import time
 
-def initiate_test_run(product: str, product_category: str, product_description: str, profile: Profile | None = None) -> TestRun:
-    """Creates a new test run and queues the testing process."""
-    active_models = LLMModel.objects.filter(is_active=True)
+def build_test_plan(models: List[LLMModel]) -> List[Tuple[LLMModel, Type[BaseLLMTest]]]:
+    """The (model, test) pairs to run, each model's tests resolved once from the registry index."""
+    return [
+        (model, test_class)
+        for model in models
+        for test_class in test_registry.get_available_tests(model)
+    ]
+
+def build_task_context(test_run: TestRun, llm_model: LLMModel, test_name: str) -> dict:
+    """Everything run_test needs, so the worker can reach the LLM without reading the database"""
+    return {
+        "test_run_id": test_run.id,
+        "batch_id": test_run.batch_id,
+        "test_name": test_name,
+        "product": test_run.product,
+        "product_category": test_run.product_category,
+        "product_description": test_run.product_description,
+        "cache_bypass": test_run.cache_bypass,
+        "cache_max_age": test_run.cache_max_age,
+        "cassette_mode": test_run.cassette_mode or None,
+        "cassette": test_run.cassette or None,
+        # Lets the worker trace how long the task sat in the queue
+        "enqueued_at": time.time(),
+        "model": {
+            "id": llm_model.id,
+            "model_name": llm_model.model_name,
+            "capabilities": list(llm_model.capabilities),
+            "requests_per_minute": llm_model.requests_per_minute,
+            "tokens_per_minute": llm_model.tokens_per_minute,
+            "input_price_per_million": str(llm_model.input_price_per_million) if llm_model.input_price_per_million is not None else None,
+            "output_price_per_million": str(llm_model.output_price_per_million) if llm_model.output_price_per_million is not None else None,
+            "date_modified": llm_model.date_modified.isoformat() if llm_model.date_modified else None,
+            "provider": {
+                "id": llm_model.provider_id,
+                "name": llm_catalog.provider_name(llm_model.provider_id) or llm_model.provider.name
+            }
+        }
+    }
+
+def build_test_tasks(test_run: TestRun, plan: List[Tuple[LLMModel, Type[BaseLLMTest]]]) -> List[dict]:
+    """bulk_async_task entries running each test of the plan for a run"""
+    return [
+        {
+            "func": 'core.tasks.llm_tasks.run_test',
+            "args": (build_task_context(test_run, model, test_class.test_name()),),
+            "task_name": f"test_{test_run.id}_{model.id}_{test_class.test_name()}",
+            "hook": 'core.tasks.llm_tasks.test_complete'
+        }
+        for model, test_class in plan
+    ]
+
+def initiate_test_run(
+    product: str,
+    product_category: str,
+    product_description: str,
+    profile: Profile | None = None,
+    bypass_cache: bool = False,
+    cassette_mode: str = '',
+    cassette: str = '',
+    recurring_run: RecurringRun | None = None,
+    previous_run: TestRun | None = None
+) -> TestRun:
+    """
+    Creates a new test run and queues the testing process. Set bypass_cache to always query the LLMs,
+    and cassette_mode to record the run's LLM calls to, or replay them from, the named cassette.
+    Runs of a recurring_run reuse answers within its freshness window and are diffed against previous_run.
+    """
+    started = time.monotonic()
+    plan = build_test_plan(llm_catalog.active_models())
+
+    test_run = TestRun.objects.create(
+        profile=profile,
+        product=product,
+        product_category=product_category,
+        product_description=product_description,
+        status=TestRun.Status.IN_PROGRESS,
+        total_tests=len(plan),
+        cache_bypass=bypass_cache,
+        cassette_mode=cassette_mode,
+        cassette=cassette,
+        recurring_run=recurring_run,
+        previous_run=previous_run,
+        cache_max_age=recurring_run.freshness_hours * 60 * 60 if recurring_run is not None else None
+    )
+
+    # Queue every test task in one broker operation, each carrying its own context
+    bulk_async_task(build_test_tasks(test_run, plan))
+
+    TEST_RUNS_INITIATED.inc()
+    TASKS_ENQUEUED.inc(len(plan))
+    INITIATE_DURATION.observe(time.monotonic() - started)
+    metrics.flush()
+
+    return test_run
+
+def submit_test_batch(
+    products: List[dict],
+    profile: Profile | None = None,
+    name: str = '',
+    bypass_cache: bool = False,
+    max_active_runs: int | None = None
+) -> TestBatch:
+    """
+    Creates a batch and one pending test run per product dict (product, product_category,
+    product_description) in a single transaction, then starts its first runs.
+    Later runs are started by dispatch_test_batch as earlier ones finish.
+    """
+    started = time.monotonic()
+    plan_size = len(build_test_plan(llm_catalog.active_models()))
 
     with transaction.atomic():
-        test_run = TestRun.objects.create(
+        batch = TestBatch.objects.create(
             profile=profile,
-            product=product,
-            product_category=product_category,
-            product_description=product_description,
-            status=TestRun.Status.IN_PROGRESS,
-            total_tests=0
+            name=name,
+            total_runs=len(products),
+            max_active_runs=max_active_runs or getattr(settings, "LLM_BATCH_MAX_ACTIVE_RUNS", 4)
         )
-        
-        # Calculate and set total tests atomically
-        total_tests = 0
-        for model in active_models:
-            available_tests = test_registry.get_available_tests(model)
-            total_tests += len(available_tests)
-        
-        test_run.total_tests = total_tests
-        test_run.save()
-
-    # Spawn individual test tasks directly for each model
-    for model in active_models:
-        available_test_classes = test_registry.get_available_tests(model)
-        for test_class in available_test_classes:
-            test_name = test_class.test_name()
-            task_name = f"test_{test_run.id}_{model.id}_{test_name}"
-            async_task(
-                'core.tasks.llm_tasks.run_test',
-                test_run.id,
-                model.id,
-                test_name,
-                task_name=task_name,
-                hook='core.tasks.llm_tasks.test_complete'
+        TestRun.objects.bulk_create([
+            TestRun(
+                profile=profile,
+                batch=batch,
+                product=product["product"],
+                product_category=product.get("product_category"),
+                product_description=product.get("product_description"),
+                status=TestRun.Status.PENDING,
+                total_tests=plan_size,
+                cache_bypass=bypass_cache
             )
+            for product in products
+        ], batch_size=500)
+        transaction.on_commit(lambda: dispatch_test_batch(batch.id))
 
-    return test_run
+    TEST_RUNS_INITIATED.inc(len(products))
+    INITIATE_DURATION.observe(time.monotonic() - started)
+    metrics.flush()
+
+    return batch
+
+def dispatch_test_batch(batch_id: str) -> int:
+    """
+    Start pending runs of a batch until max_active_runs of them are in progress,
+    and mark the batch completed once none are left. Batch tasks go to the
+    LLM_BATCH_QUEUE broker list when it is set, so a separate cluster can work
+    them without holding up interactive runs. Returns the number of runs started.
+    """
+    with transaction.atomic():
+        # Locking the batch serializes the hooks of concurrently finishing runs
+        batch = TestBatch.objects.select_for_update().filter(id=batch_id).first()
+        if batch is None or batch.status != TestBatch.Status.IN_PROGRESS:
+            return 0
+
+        active = batch.runs.filter(status=TestRun.Status.IN_PROGRESS).count()
+        runs = list(
+            batch.runs.filter(status=TestRun.Status.PENDING)
+            .order_by('date_created', 'id')[:max(batch.max_active_runs - active, 0)]
+        )
+        if not runs:
+            if not active:
+                batch.status = TestBatch.Status.COMPLETED
+                batch.save(update_fields=['status', 'date_modified'])
+            return 0
+
+        # The plan is resolved now, so a run's total_tests matches the tasks it is given
+        plan = build_test_plan(llm_catalog.active_models())
+        TestRun.objects.filter(id__in=[run.id for run in runs]).update(
+            status=TestRun.Status.IN_PROGRESS,
+            total_tests=len(plan)
+        )
+        tasks = [task for run in runs for task in build_test_tasks(run, plan)]
+
+        queue = getattr(settings, "LLM_BATCH_QUEUE", None)
+        transaction.on_commit(lambda: bulk_async_task(tasks, broker=get_broker(queue) if queue else None))
+
+    TASKS_ENQUEUED.inc(len(tasks))
+    metrics.flush()
+    return len(runs)
+
+def record_test_completion(test_run_id: str, failed: bool, stats: dict | None = None) -> dict | None:
+    """
+    Count one finished test against its run in a single UPDATE ... RETURNING.
+    The run flips to COMPLETED, or FAILED if any of its tests failed, in the
+    same statement that counts its last test, so concurrent hooks can't race.
+    Returns the run's new status and counters, or None if it doesn't exist.
+    """
+    stats = stats or {}
+    table = connection.ops.quote_name(TestRun._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {table} SET
+                completed_tests = completed_tests + 1,
+                failed_tests = failed_tests + %(failed)s,
+                cache_hits = cache_hits + %(cache_hits)s,
+                cache_misses = cache_misses + %(cache_misses)s,
+                rate_limit_wait_seconds = rate_limit_wait_seconds + %(rate_limit_wait_seconds)s,
+                prompt_tokens = prompt_tokens + %(prompt_tokens)s,
+                completion_tokens = completion_tokens + %(completion_tokens)s,
+                cost = cost + %(cost)s,
+                status = CASE
+                    WHEN status <> %(in_progress)s OR completed_tests + 1 < total_tests THEN status
+                    WHEN failed_tests + %(failed)s > 0 THEN %(failed_status)s
+                    ELSE %(completed_status)s
+                END,
+                date_modified = NOW()
+            WHERE id = %(id)s
+            RETURNING status, total_tests, completed_tests, failed_tests, prompt_tokens, completion_tokens, cost, batch_id, previous_run_id
+        """, {
+            "id": test_run_id,
+            "failed": int(failed),
+            "cache_hits": stats.get("cache_hits", 0),
+            "cache_misses": stats.get("cache_misses", 0),
+            "rate_limit_wait_seconds": stats.get("rate_limit_wait_seconds", 0),
+            "prompt_tokens": int(stats.get("prompt_tokens", 0)),
+            "completion_tokens": int(stats.get("completion_tokens", 0)),
+            "cost": Decimal(str(round(stats.get("cost", 0), 6))),
+            "in_progress": TestRun.Status.IN_PROGRESS,
+            "failed_status": TestRun.Status.FAILED,
+            "completed_status": TestRun.Status.COMPLETED,
+        })
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+    status, total_tests, completed_tests, failed_tests, prompt_tokens, completion_tokens, cost, batch_id, previous_run_id = row
+    return {
+        "batch_id": batch_id,
+        "previous_run_id": previous_run_id,
+        "status": status,
+        "total_tests": total_tests,
+        "completed_tests": completed_tests,
+        "failed_tests": failed_tests,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": cost
+    }
 
 def test_run_complete(task: Task):
     print(task.result)
@@ -58,11 +261,124 @@ def get_test_run_progress(test_run_id: str) -> dict:
             'status': test_run.status,
             'total_tests': test_run.total_tests,
             'completed_tests': test_run.completed_tests,
+            'failed_tests': test_run.failed_tests,
+            'prompt_tokens': test_run.prompt_tokens,
+            'completion_tokens': test_run.completion_tokens,
+            'cost': test_run.cost,
             'progress_percentage': round(progress, 2),
             'results': list(test_run.results.values(
                 'llm_model__model_name',
-                'processed_data'
+                'test_name',
+                'success',
+                'readable_response',
+                'structured_data'
             )) if test_run.status == TestRun.Status.COMPLETED else []
         }
     except TestRun.DoesNotExist:
         return {'error': 'Test run not found'}
+
+def get_test_batch_progress(batch_id: str) -> dict:
+    """Aggregate progress of every run in a batch."""
+    try:
+        batch = TestBatch.objects.get(id=batch_id)
+    except TestBatch.DoesNotExist:
+        return {'error': 'Test batch not found'}
+
+    totals = batch.runs.aggregate(
+        total_tests=Sum('total_tests', default=0),
+        completed_tests=Sum('completed_tests', default=0),
+        failed_tests=Sum('failed_tests', default=0),
+        prompt_tokens=Sum('prompt_tokens', default=0),
+        completion_tokens=Sum('completion_tokens', default=0),
+        cost=Sum('cost', default=Decimal(0))
+    )
+    runs = dict(batch.runs.values_list('status').annotate(count=Count('id')).order_by())
+    progress = (totals['completed_tests'] / totals['total_tests'] * 100) if totals['total_tests'] > 0 else 0
+
+    return {
+        'name': batch.name,
+        'status': batch.status,
+        'total_runs': batch.total_runs,
+        'runs': {status: runs.get(status, 0) for status in TestRun.Status.values},
+        **totals,
+        'progress_percentage': round(progress, 2)
+    }
+
+def summarize_result(test_name: str, structured_data: dict | None) -> dict:
+    """The figures of a test's structured data that are compared between runs"""
+    data = structured_data or {}
+    if test_name == "mention_frequency":
+        stats = data.get("brand_stats", {})
+        return {
+            "mentions": stats.get("mention_count"),
+            "competitor_mentions": stats.get("competitor_mention_count"),
+            "competitors": list(stats.get("competitors", {}))
+        }
+    if test_name == "competitor_comparison":
+        return {"competitors": [comparison["name"] for comparison in data.get("comparisons", [])]}
+    if test_name == "product_sentiment_analysis":
+        return {"sentiment": data.get("overall_sentiment"), "sentiment_distribution": data.get("sentiment_distribution", {})}
+    if test_name == "sentiment_analysis":
+        return {"sentiment": data.get("sentiment")}
+    if test_name == "feature_recognition":
+        return {"features": data.get("compiled_understanding", {}).get("key_features", [])}
+    return {}
+
+def _diff_summaries(old: dict, new: dict) -> dict:
+    changes = {}
+    for name, value in new.items():
+        previous = old.get(name)
+        if isinstance(value, list) and isinstance(previous, list):
+            added = sorted(set(value) - set(previous))
+            dropped = sorted(set(previous) - set(value))
+            if added:
+                changes[f"new_{name}"] = added
+            if dropped:
+                changes[f"dropped_{name}"] = dropped
+        elif isinstance(value, dict) and isinstance(previous, dict):
+            shifts = {key: value.get(key, 0) - previous.get(key, 0) for key in value.keys() | previous.keys()}
+            shifts = {key: shift for key, shift in shifts.items() if shift}
+            if shifts:
+                changes[f"{name}_change"] = shifts
+        elif isinstance(value, (int, float)) and isinstance(previous, (int, float)):
+            if value != previous:
+                changes[f"{name}_change"] = value - previous
+        elif value != previous:
+            changes[name] = {"from": previous, "to": value}
+    return changes
+
+def build_run_diff(test_run: TestRun) -> dict | None:
+    """
+    Compact changes of a run against its previous_run, per model and test:
+    mention count changes, new and dropped competitors and sentiment shifts.
+    """
+    if test_run.previous_run_id is None:
+        return None
+
+    def summaries(run_id):
+        return {
+            f"{model_name}/{test_name}": summarize_result(test_name, structured_data)
+            for model_name, test_name, structured_data in TestResult.objects.filter(
+                test_run_id=run_id,
+                success=True
+            ).values_list('llm_model__model_name', 'test_name', 'structured_data')
+        }
+
+    previous, current = summaries(test_run.previous_run_id), summaries(test_run.id)
+    results = {}
+    for key, summary in current.items():
+        if key not in previous:
+            results[key] = {"new": True}
+            continue
+        changes = _diff_summaries(previous[key], summary)
+        if changes:
+            results[key] = changes
+
+    return {
+        "previous_run": test_run.previous_run_id,
+        # Answers served from the previous runs' cached responses instead of re-queried
+        "reused_answers": test_run.cache_hits,
+        "missing": sorted(key for key in previous if key not in current),
+        "results": results
+    }
+
@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.llms.mock_gateway import MockGateway, MockGatewayConfig
+from core.logic import initiate_test_run
+from core.models import TestRun, TestResult
+from statistics import mean, quantiles
+from urllib.parse import urlparse
+import time
+
+class Command(BaseCommand):
+    help = (
+        "Run full test runs through django-q and report throughput. Workers must be running "
+        "(or Q_CLUSTER sync) with LLM_GATEWAY_URL pointing at a mock gateway."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--product', default="Benchmark Product")
+        parser.add_argument('--category', default="Software")
+        parser.add_argument('--description', default="A product used to benchmark the test pipeline.")
+        parser.add_argument('--use-cache', action='store_true', help="Let runs use the response cache")
+        parser.add_argument('--cassette-mode', choices=TestRun.CassetteMode.values, default='', help="Record the runs' LLM calls, or replay them without a gateway")
+        parser.add_argument('--cassette', default='')
+        parser.add_argument('--timeout', type=float, default=600, help="Seconds to wait for the runs to finish")
+        parser.add_argument('--start-gateway', action='store_true', help="Serve a mock gateway at LLM_GATEWAY_URL from this process")
+        parser.add_argument('--latency', type=float, default=0.5)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+
+    def handle(self, *args, runs, timeout, **options):
+        gateway_url = getattr(settings, "LLM_GATEWAY_URL", None)
+        if not gateway_url and options['cassette_mode'] != TestRun.CassetteMode.REPLAY:
+            raise CommandError("Set LLM_GATEWAY_URL so benchmark runs don't reach the real gateway")
+
+        server = gateway = None
+        if options['start_gateway'] and gateway_url:
+            url = urlparse(gateway_url)
+            gateway = MockGateway(MockGatewayConfig(
+                latency=options['latency'],
+                error_rate=options['error_rate'],
+                rate_limit_rate=options['rate_limit_rate']
+            ))
+            server = gateway.start(url.hostname, url.port or 80)
+
+        try:
+            started = time.monotonic()
+            run_ids, initiate_queries = [], []
+            for i in range(runs):
+                with CaptureQueriesContext(connection) as queries:
+                    test_run = initiate_test_run(
+                        f"{options['product']} {i + 1}",
+                        options['category'],
+                        options['description'],
+                        bypass_cache=not options['use_cache'],
+                        cassette_mode=options['cassette_mode'],
+                        cassette=options['cassette']
+                    )
+                run_ids.append(test_run.id)
+                initiate_queries.append(len(queries))
+            initiated = time.monotonic() - started
+
+            pending = set(run_ids)
+            while pending and time.monotonic() - started < timeout:
+                done = TestRun.objects.filter(
+                    id__in=pending,
+                    status__in=[TestRun.Status.COMPLETED, TestRun.Status.FAILED]
+                ).values_list('id', flat=True)
+                pending -= set(done)
+                if pending:
+                    time.sleep(0.5)
+            elapsed = time.monotonic() - started
+        finally:
+            if server is not None:
+                server.shutdown()
+
+        if pending:
+            self.stdout.write(self.style.WARNING(f"{len(pending)} of {runs} runs unfinished after {timeout:.0f}s"))
+        finished = runs - len(pending)
+
+        self.stdout.write(f"Initiated {runs} runs in {initiated:.2f}s, {mean(initiate_queries):.1f} queries per initiate")
+        self.stdout.write(f"Finished {finished} runs in {elapsed:.2f}s: {finished / elapsed * 60:.2f} runs/minute")
+        if gateway is not None:
+            self.stdout.write(f"Mock gateway served {gateway.requests} requests")
+        self.report_tests(run_ids)
+
+    def report_tests(self, run_ids):
+        """Per-test wall time, queue wait and query counts, read from the results' traces"""
+        by_test, queue_waits = {}, []
+        for test_name, trace in TestResult.objects.filter(test_run_id__in=run_ids).exclude(trace=None).values_list('test_name', 'trace'):
+            for span_id, parent_id, name, start_ms, duration_ms, attributes in trace["spans"]:
+                if name == "test":
+                    by_test.setdefault(test_name, []).append((duration_ms / 1000, attributes.get("db_queries", 0)))
+                elif name == "queue":
+                    queue_waits.append(duration_ms / 1000)
+
+        if queue_waits:
+            self.stdout.write(f"Queue wait: {self.summarize(queue_waits)}")
+        self.stdout.write("Per-test wall time (s) and DB queries:")
+        for test_name, samples in sorted(by_test.items()):
+            durations = [duration for duration, _ in samples]
+            db_queries = mean(count for _, count in samples)
+            self.stdout.write(f"  {test_name}: n={len(samples)} {self.summarize(durations)} queries={db_queries:.1f}")
+
+    def summarize(self, values):
+        if len(values) < 2:
+            return f"mean={mean(values):.3f}"
+        cuts = quantiles(values, n=20)
+        return f"mean={mean(values):.3f} p50={cuts[9]:.3f} p95={cuts[18]:.3f} max={max(values):.3f}"
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from core.models import TestResult
+from core.blobs import delete_orphans
+
+class Command(BaseCommand):
+    help = "Move inline TestResult.raw_responses into the compressed blob store"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--delete-orphans', action='store_true', help="Also delete blobs no result refers to")
+
+    def handle(self, *args, batch_size, **options):
+        migrated = 0
+        while True:
+            batch = list(
+                TestResult.objects.filter(raw_responses__isnull=False)
+                .only('id', 'raw_responses')
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+
+            for test_result in batch:
+                test_result.set_raw_responses(test_result.raw_responses)
+            TestResult.objects.bulk_update(batch, ['raw_responses', 'raw_responses_blob'])
+
+            migrated += len(batch)
+            self.stdout.write(f"Migrated {migrated} results")
+
+        if options['delete_orphans']:
+            self.stdout.write(f"Deleted {delete_orphans()} orphaned blobs")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {migrated} results moved to the blob store"))
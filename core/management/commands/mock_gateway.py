@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from core.llms.mock_gateway import MockGateway, MockGatewayConfig
+import json
+
+class Command(BaseCommand):
+    help = "Serve a local stand-in for the AI Gateway universal endpoint; point LLM_GATEWAY_URL at it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8787)
+        parser.add_argument('--latency', type=float, default=0.5, help="Typical response time in seconds")
+        parser.add_argument('--jitter', type=float, default=0.2)
+        parser.add_argument('--distribution', choices=['fixed', 'uniform', 'lognormal'], default='lognormal')
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a 500")
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of requests answered with a 429")
+        parser.add_argument('--retry-after', type=int, default=1)
+        parser.add_argument('--responses', help="JSON file of canned answers, [{\"match\": ..., \"content\": ...}]")
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, host, port, **options):
+        responses = []
+        if options['responses']:
+            with open(options['responses']) as f:
+                responses = json.load(f)
+
+        gateway = MockGateway(MockGatewayConfig(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            distribution=options['distribution'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            retry_after=options['retry_after'],
+            responses=responses,
+            seed=options['seed']
+        ))
+        server = gateway.serve(host, port)
+        self.stdout.write(self.style.SUCCESS(f"Mock gateway listening on http://{host}:{port}/"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served {gateway.requests} requests")
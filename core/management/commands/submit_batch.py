@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.logic import submit_test_batch
+import csv
+import json
+import os
+
+FIELDS = ('product', 'product_category', 'product_description')
+
+class Command(BaseCommand):
+    help = "Submit a batch of test runs from a CSV, JSON array or JSONL file with product, product_category and product_description"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json', 'jsonl'], help="Defaults to the file extension")
+        parser.add_argument('--name', help="Defaults to the file name")
+        parser.add_argument('--bypass-cache', action='store_true')
+        parser.add_argument('--max-active-runs', type=int, help="Runs of the batch in progress at once")
+
+    def handle(self, *args, path, **options):
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in ('json', 'jsonl'):
+            file_format = 'csv'
+        with open(path, newline='', encoding='utf-8') as f:
+            if file_format == 'csv':
+                rows = list(csv.DictReader(f))
+            elif file_format == 'json':
+                rows = json.load(f)
+                if not isinstance(rows, list):
+                    raise CommandError("A JSON file must hold an array of products")
+            else:
+                rows = [json.loads(line) for line in f if line.strip()]
+
+        products = []
+        for number, row in enumerate(rows, start=1):
+            if not (row.get('product') or '').strip():
+                raise CommandError(f"Row {number} has no product")
+            products.append({field: (row.get(field) or '').strip() or None for field in FIELDS})
+        if not products:
+            raise CommandError("No products to submit")
+
+        batch = submit_test_batch(
+            products,
+            name=options['name'] or os.path.basename(path),
+            bypass_cache=options['bypass_cache'],
+            max_active_runs=options['max_active_runs']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Submitted batch {batch.id} with {len(products)} runs"))
@@ -0,0 +1,270 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+from django.conf import settings
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), collect: Callable[[], Dict[Tuple[str, ...], float]] | None = None):
+        super().__init__(name, documentation, labelnames)
+        # Gauges with a collect callback are computed at scrape time instead of tracked
+        self.collect = collect
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts = list(counts)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+class MetricsRegistry:
+    """
+    Process-local metrics rendered in the Prometheus text format. When
+    settings.METRICS_DIR is set, each process writes its values there on flush()
+    and render() merges every process's file, so the web process can expose
+    what the django-q workers recorded.
+    """
+    # Minimum seconds between two snapshot writes from the same process
+    FLUSH_INTERVAL = 1.0
+    # Seconds after which files of exited processes are deleted instead of merged
+    STALE_AFTER = getattr(settings, "METRICS_STALE_SECONDS", 24 * 60 * 60)
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._last_flush = 0.0
+        self.directory = getattr(settings, "METRICS_DIR", None)
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self._metrics.items() if not getattr(metric, "collect", None)}
+
+    def flush(self, force: bool = False):
+        """Write this process's values to METRICS_DIR, at most once per FLUSH_INTERVAL"""
+        if not self.directory or (not force and time.monotonic() - self._last_flush < self.FLUSH_INTERVAL):
+            return
+        self._last_flush = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"pid": os.getpid(), "metrics": self.snapshot()}, f)
+        os.replace(tmp_path, os.path.join(self.directory, f"metrics_{os.getpid()}.json"))
+
+    def _process_snapshots(self) -> List[Tuple[bool, dict]]:
+        """(process alive, snapshot) for this process and every other process that flushed"""
+        snapshots = [(True, self.snapshot())]
+        if not self.directory or not os.path.isdir(self.directory):
+            return snapshots
+
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith(".tmp"):
+                # Left behind by a process killed mid-flush
+                self._delete_if_stale(path, now)
+                continue
+            if not filename.startswith("metrics_") or not filename.endswith(".json"):
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get("pid") == os.getpid():
+                continue
+            alive = _pid_alive(data.get("pid"))
+            if not alive and self._delete_if_stale(path, now):
+                continue
+            snapshots.append((alive, data.get("metrics", {})))
+        return snapshots
+
+    def _delete_if_stale(self, path: str, now: float) -> bool:
+        """Delete a file last written more than STALE_AFTER seconds ago, returning whether it was"""
+        try:
+            if now - os.path.getmtime(path) < self.STALE_AFTER:
+                return False
+            os.remove(path)
+        except OSError:
+            return False
+        return True
+
+    def render(self) -> str:
+        merged: Dict[str, dict] = {name: {} for name in self._metrics}
+        for alive, snapshot in self._process_snapshots():
+            for name, values in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                # Gauges of exited processes no longer describe anything
+                if metric.type == "gauge" and not alive:
+                    continue
+                for key, value in values:
+                    key = tuple(key)
+                    if metric.type == "histogram":
+                        counts, total = merged[name].get(key, ([0] * len(metric.buckets), 0.0))
+                        merged[name][key] = ([a + b for a, b in zip(counts, value[0])], total + value[1])
+                    else:
+                        merged[name][key] = merged[name].get(key, 0) + value
+
+        lines = []
+        for name, metric in self._metrics.items():
+            values = metric.collect() if getattr(metric, "collect", None) else merged[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(values.items()):
+                labels = dict(zip(metric.labelnames, key))
+                if metric.type == "histogram":
+                    counts, total = value
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def _pid_alive(pid) -> bool:
+    if not isinstance(pid, int):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _queue_depth() -> Dict[Tuple[str, ...], float]:
+    from django_q.brokers import get_broker
+    try:
+        return {(): get_broker().queue_size() or 0}
+    except Exception:
+        return {}
+
+# Module-level singleton
+metrics = MetricsRegistry()
+
+LLM_REQUESTS = metrics.counter(
+    "llm_requests_total", "LLM queries by outcome (success, error, cache_hit, replay or cancelled, for abandoned streams)",
+    ("provider", "model", "test_name", "outcome")
+)
+LLM_REQUEST_DURATION = metrics.histogram(
+    "llm_request_duration_seconds", "Wall time of LLM queries, including retries and rate limit waits",
+    ("provider", "model", "test_name", "outcome")
+)
+LLM_TIME_TO_FIRST_TOKEN = metrics.histogram(
+    "llm_time_to_first_token_seconds", "Time from starting a streamed query to its first content delta",
+    ("provider", "model", "test_name"), buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+LLM_TOKENS_PER_SECOND = metrics.histogram(
+    "llm_stream_tokens_per_second", "Completion tokens per second of streamed queries after the first token",
+    ("provider", "model", "test_name"), buckets=(5, 10, 20, 40, 60, 80, 100, 150, 200, 300)
+)
+LLM_IN_FLIGHT = metrics.gauge(
+    "llm_requests_in_flight", "LLM queries currently waiting on a provider", ("provider", "model")
+)
+TESTS = metrics.counter(
+    "llm_tests_total", "Tests run by workers by outcome", ("model", "test_name", "outcome")
+)
+TEST_DURATION = metrics.histogram(
+    "llm_test_duration_seconds", "Wall time of run_test", ("model", "test_name", "outcome")
+)
+TEST_COMPLETIONS = metrics.counter(
+    "llm_test_completions_total", "Finished tests counted by the completion hook", ("outcome",)
+)
+TEST_RUNS_INITIATED = metrics.counter(
+    "llm_test_runs_initiated_total", "Test runs created by initiate_test_run"
+)
+TASKS_ENQUEUED = metrics.counter(
+    "llm_test_tasks_enqueued_total", "Test tasks queued by initiate_test_run"
+)
+INITIATE_DURATION = metrics.histogram(
+    "llm_initiate_test_run_duration_seconds", "Wall time of initiate_test_run",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+QUEUE_DEPTH = metrics.gauge(
+    "django_q_queue_depth", "Tasks waiting in the django-q broker", collect=_queue_depth
+)
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from shortuuid.django_fields import ShortUUIDField
 from django.db.models.signals import post_save
@@ -55,6 +56,12 @@ class LLMModel(models.Model):
         max_length=255,
         default=Capabilities.CHAT
     )
+    # Provider rate limits for this model, unlimited when empty
+    requests_per_minute = models.PositiveIntegerField(null=True, blank=True)
+    tokens_per_minute = models.PositiveIntegerField(null=True, blank=True)
+    # Prices in USD per million tokens, used for cost accounting
+    input_price_per_million = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)
+    output_price_per_million = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)
 
     date_created = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
@@ -64,7 +71,61 @@ class LLMModel(models.Model):
         unique_together = ('provider', 'model_name')
 
     def __str__(self):
-        return f"{self.provider.name} - {self.model_name}"
+        from core.llms.catalog import llm_catalog
+        return f"{llm_catalog.provider_name(self.provider_id) or self.provider.name} - {self.model_name}"
+
+    def get_cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        """Cost in USD of a call, zero for prices that aren't set"""
+        input_price = float(self.input_price_per_million or 0)
+        output_price = float(self.output_price_per_million or 0)
+        return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+class TestBatch(models.Model):
+    """Test runs submitted together, started a few at a time by core.logic.dispatch_test_batch"""
+    class Status(models.TextChoices):
+        IN_PROGRESS = 'in_progress', 'In Progress'
+        COMPLETED = 'completed', 'Completed'
+
+    id = ShortUUIDField(primary_key=True)
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, null=True, blank=True)
+    name = models.CharField(max_length=255, blank=True, default='')
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.IN_PROGRESS)
+    total_runs = models.IntegerField(default=0)
+    # Runs of the batch allowed in progress at once
+    max_active_runs = models.IntegerField(default=4)
+
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date_created']
+
+class RecurringRun(models.Model):
+    """
+    A product re-tested every interval_hours, reusing answers younger than freshness_hours.
+    Reuse goes through the response cache, so it silently stops, and every run
+    re-queries the LLMs, when LLM_CACHE_ENABLED is off or the cached rows have
+    been pruned (expired, or beyond MAX_DB_ENTRIES).
+    """
+    id = ShortUUIDField(primary_key=True)
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, null=True, blank=True)
+    product = models.CharField(max_length=255)
+    product_category = models.CharField(max_length=255, null=True, blank=True)
+    product_description = models.TextField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    interval_hours = models.IntegerField(default=7 * 24)
+    # Answers stored within this many hours are reused instead of re-queried. Keep it above
+    # interval_hours: a run starts a little more than one interval after the answers it should reuse
+    freshness_hours = models.IntegerField(default=8 * 24)
+
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date_created']
+
+    def __str__(self):
+        return self.product
 
 class TestRun(models.Model):
     class Status(models.TextChoices):
@@ -73,8 +134,16 @@ class TestRun(models.Model):
         COMPLETED = 'completed', 'Completed'
         FAILED = 'failed', 'Failed'
 
+    class CassetteMode(models.TextChoices):
+        OFF = 'off', 'Off'
+        RECORD = 'record', 'Record'
+        REPLAY = 'replay', 'Replay'
+
     id = ShortUUIDField(primary_key=True)
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE, null=True, blank=True)
+    batch = models.ForeignKey(TestBatch, on_delete=models.CASCADE, null=True, blank=True, related_name='runs')
+    recurring_run = models.ForeignKey(RecurringRun, on_delete=models.SET_NULL, null=True, blank=True, related_name='runs')
+    previous_run = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='next_runs')
     product = models.CharField(max_length=255)
     product_category = models.CharField(max_length=255, null=True, blank=True)
     product_description = models.TextField(null=True, blank=True)
@@ -85,7 +154,28 @@ class TestRun(models.Model):
         default=Status.PENDING
     )
     total_tests = models.IntegerField(default=0)
+    # Finished tests, including the failed_tests that errored
     completed_tests = models.IntegerField(default=0)
+    failed_tests = models.IntegerField(default=0)
+
+    # Skip the LLM response cache for every call made by this run
+    cache_bypass = models.BooleanField(default=False)
+    cache_hits = models.IntegerField(default=0)
+    cache_misses = models.IntegerField(default=0)
+    rate_limit_wait_seconds = models.FloatField(default=0)
+
+    # Record or replay LLM calls, see core.llms.cassette; blank uses the LLM_CASSETTE_MODE and LLM_CASSETTE settings
+    cassette_mode = models.CharField(max_length=10, choices=CassetteMode.choices, blank=True, default='')
+    cassette = models.CharField(max_length=100, blank=True, default='')
+    # Reuse cached answers stored within this many seconds; set for recurring runs
+    cache_max_age = models.IntegerField(null=True, blank=True)
+    # Changes against previous_run, see core.logic.build_run_diff
+    diff = models.JSONField(null=True, blank=True)
+
+    # Usage totals across every result of the run
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=6, default=0)
     
     date_created = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
@@ -93,6 +183,25 @@ class TestRun(models.Model):
     class Meta:
         ordering = ['-date_created']
 
+class Blob(models.Model):
+    """Compressed payload addressed by the SHA-256 of its content, see core.blobs"""
+    class Codec(models.TextChoices):
+        ZSTD = 'zstd', 'Zstandard'
+        GZIP = 'gzip', 'Gzip'
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    codec = models.CharField(max_length=10, choices=Codec.choices)
+    # Uncompressed size in bytes
+    size = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    date_created = models.DateTimeField(auto_now_add=True)
+    # Refreshed whenever store_json dedupes onto this blob, so delete_orphans spares it
+    date_used = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['-date_created']
+
 class TestResult(models.Model):
     id = ShortUUIDField(primary_key=True)
     test_run = models.ForeignKey(TestRun, on_delete=models.CASCADE, related_name='results')
@@ -101,12 +210,65 @@ class TestResult(models.Model):
     success = models.BooleanField(default=False)
     error = models.TextField(null=True, blank=True)
     readable_response = models.TextField(null=True, blank=True)
+    # Inline raw responses from before the blob store; new results use raw_responses_blob
     raw_responses = models.JSONField(null=True, blank=True)
+    raw_responses_blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='test_results')
     structured_data = models.JSONField(null=True, blank=True)
     metadata = models.JSONField(null=True, blank=True)
+
+    # Usage of every LLM call the test made, including analysis calls
+    llm_calls = models.IntegerField(default=0)
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    llm_latency_seconds = models.FloatField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    # The same figures broken down by model name
+    usage = models.JSONField(null=True, blank=True)
+    # Spans of the test's LLM calls, see core.llms.tracing
+    trace = models.JSONField(null=True, blank=True)
     
     date_created = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-date_created']
+
+    def get_raw_responses(self):
+        """Raw responses, loaded from the blob store on first access"""
+        if self.raw_responses_blob_id is None:
+            return self.raw_responses
+        if not hasattr(self, '_raw_responses_cache'):
+            from core.blobs import load_json
+            self._raw_responses_cache = load_json(self.raw_responses_blob_id)
+        return self._raw_responses_cache
+
+    def set_raw_responses(self, value):
+        """Store raw responses in the blob store and reference them from this result"""
+        from core.blobs import store_json
+        self.raw_responses = None
+        self.raw_responses_blob_id = store_json(value) if value is not None else None
+        self._raw_responses_cache = value
+
+class LLMResponseCache(models.Model):
+    """Shared tier of the LLM response cache, see core.llms.cache"""
+    id = ShortUUIDField(primary_key=True)
+    key = models.CharField(max_length=64, unique=True)
+    provider = models.CharField(max_length=100)
+    model_name = models.CharField(max_length=100)
+    response = models.JSONField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+    # When the response was last stored, for freshness checks
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date_created']
+
+class RateLimitBucket(models.Model):
+    """Shared token bucket state for core.llms.ratelimit"""
+    id = ShortUUIDField(primary_key=True)
+    key = models.CharField(max_length=255, unique=True)
+    level = models.FloatField()
+
+    date_modified = models.DateTimeField(auto_now=True)
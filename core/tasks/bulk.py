@@ -0,0 +1,86 @@
+# tasks/bulk.py
+from datetime import timedelta
+from typing import List
+from django.utils import timezone
+from django_q.brokers import get_broker, Broker
+from django_q.brokers.orm import ORM
+from django_q.conf import Conf
+from django_q.humanhash import uuid
+from django_q.signals import pre_enqueue
+from django_q.signing import SignedPackage
+from django_q.tasks import async_task
+
+# Task options carried in the package, as async_task accepts them
+OPTIONS = ("hook", "group", "save", "cached", "ack_failure", "iter_count", "iter_cached", "chain", "timeout")
+
+def build_package(task: dict) -> dict:
+    """
+    The package async_task would build for a task: options from the task dict,
+    cached and ack_failure defaulting to Conf.CACHED and Conf.ACK_FAILURES, and
+    the pre_enqueue signal sent before it is signed.
+    """
+    tag = uuid()
+    package = {
+        "id": tag[1],
+        "name": task.get("task_name") or tag[0],
+        "func": task["func"],
+        "args": tuple(task.get("args", ())),
+    }
+    for option in OPTIONS:
+        if option in task:
+            package[option] = task[option]
+    if "cached" not in package and Conf.CACHED:
+        package["cached"] = Conf.CACHED
+    if "ack_failure" not in package and Conf.ACK_FAILURES:
+        package["ack_failure"] = Conf.ACK_FAILURES
+    package["kwargs"] = task.get("kwargs", {})
+    package["started"] = timezone.now()
+    pre_enqueue.send(sender="django_q", task=package)
+    return package
+
+def bulk_async_task(tasks: List[dict], broker: Broker | None = None) -> List[str]:
+    """
+    Queue many tasks with one broker write where the broker allows it (a single
+    bulk insert for the ORM broker, a single RPUSH for Redis). Each task is a
+    dict with func, args and optionally kwargs, task_name and any async_task
+    option such as hook, group, cached or ack_failure. Returns the task ids.
+    """
+    if not tasks:
+        return []
+
+    # Sync mode runs tasks inline, which async_task already handles
+    if Conf.SYNC:
+        return [
+            async_task(
+                task["func"],
+                *task.get("args", ()),
+                q_options={option: task[option] for option in ("task_name",) + OPTIONS if option in task},
+                **task.get("kwargs", {})
+            )
+            for task in tasks
+        ]
+
+    broker = broker or get_broker()
+    ids = []
+    packages = []
+    for task in tasks:
+        package = build_package(task)
+        ids.append(package["id"])
+        packages.append(SignedPackage.dumps(package))
+
+    if isinstance(broker, ORM):
+        # The ORM broker only dequeues rows locked more than RETRY seconds ago; ORM.enqueue backdates the same way
+        lock = timezone.now() - timedelta(seconds=Conf.RETRY + 1)
+        connection = broker.get_connection()
+        connection.bulk_create([
+            connection.model(key=broker.list_key, payload=package, lock=lock)
+            for package in packages
+        ])
+    # Compared by module so ORM-only deployments never import the redis client
+    elif type(broker).__module__ == "django_q.brokers.redis_broker":
+        broker.connection.rpush(broker.list_key, *packages)
+    else:
+        for package in packages:
+            broker.enqueue(package)
+
+    return ids
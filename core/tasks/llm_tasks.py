@@ -1,68 +1,174 @@
 # tasks/llm_tasks.py
 from django_q.tasks import async_task
 from core.llms.factory import get_llm
-from core.models import TestRun, LLMModel, TestResult
+from core.models import TestRun, LLMModel, LLMProvider, TestResult
 from core.llms.tests.registry import test_registry
-from django.db.models import F
+from core.llms.context import call_context, count_db_queries, LLMCallContext
+from core.llms.tracing import Tracer
+from core.events import publish_run_event
+from core.logic import record_test_completion, dispatch_test_batch, build_task_context
+from core.metrics import metrics, TESTS, TEST_DURATION, TEST_COMPLETIONS
+from django.db import OperationalError, close_old_connections
+from django.utils.dateparse import parse_datetime
+from decimal import Decimal
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-def run_test(test_run_id: str, llm_model_id: str, test_name: str) -> dict:
-    llm_model = LLMModel.objects.get(id=llm_model_id)
+# Length of the readable response included in pushed partial results
+PARTIAL_RESPONSE_CHARS = 1000
+# Attempts at inserting the finished TestResult while the database is unavailable
+SAVE_ATTEMPTS = 3
+
+def _model_from_context(data: dict) -> LLMModel:
+    """Rebuild an unsaved LLMModel, with its provider, from a task context"""
+    provider = LLMProvider(id=data["provider"]["id"], name=data["provider"]["name"])
+    return LLMModel(
+        id=data["id"],
+        provider=provider,
+        model_name=data["model_name"],
+        capabilities=data["capabilities"],
+        requests_per_minute=data.get("requests_per_minute"),
+        tokens_per_minute=data.get("tokens_per_minute"),
+        input_price_per_million=Decimal(data["input_price_per_million"]) if data.get("input_price_per_million") else None,
+        output_price_per_million=Decimal(data["output_price_per_million"]) if data.get("output_price_per_million") else None,
+        date_modified=parse_datetime(data["date_modified"]) if data.get("date_modified") else None
+    )
+
+def _save_result(test_result: TestResult, raw_responses: list | None, tracer: Tracer):
+    """Store the raw responses and insert the finished result, riding out brief database outages"""
+    for attempt in range(1, SAVE_ATTEMPTS + 1):
+        try:
+            with tracer.span("blob.store", attempt=attempt):
+                test_result.set_raw_responses(raw_responses)
+            test_result.trace = tracer.as_dict()
+            test_result.save(force_insert=True)
+            return
+        except OperationalError:
+            if attempt == SAVE_ATTEMPTS:
+                raise
+            logger.warning(f"Saving result for test run {test_result.test_run_id} failed, retrying")
+            close_old_connections()
+            time.sleep(2 ** attempt)
+
+def _publish_result(test_result: TestResult, model_name: str):
+    """Push a compact copy of a finished result to progress listeners"""
+    publish_run_event(test_result.test_run_id, "result", {
+        "partial": {
+            "id": test_result.id,
+            "model": model_name,
+            "test_name": test_result.test_name,
+            "success": test_result.success,
+            "error": test_result.error,
+            "readable_response": (test_result.readable_response or "")[:PARTIAL_RESPONSE_CHARS]
+        }
+    })
+
+def _legacy_context(test_run_id: str, llm_model_id: str, test_name: str) -> dict:
+    """Build the context for a task queued with the old (test_run_id, llm_model_id, test_name) arguments"""
     test_run = TestRun.objects.get(id=test_run_id)
-    
-    # Create TestResult record
-    test_result = TestResult.objects.create(
-        test_run=test_run,
-        llm_model=llm_model
+    llm_model = LLMModel.objects.select_related("provider").get(id=llm_model_id)
+    return build_task_context(test_run, llm_model, test_name)
+
+def _task_test_run_id(args: tuple) -> str:
+    """The test run of a run_test task, given either argument form"""
+    return args[0]["test_run_id"] if isinstance(args[0], dict) else args[0]
+
+def run_test(context: dict | str, llm_model_id: str | None = None, test_name: str | None = None) -> dict:
+    """
+    Run one test from a build_task_context payload; the TestResult is inserted once, when it finishes.
+    Tasks queued before the payload existed pass (test_run_id, llm_model_id, test_name) and are still run.
+    """
+    if not isinstance(context, dict):
+        context = _legacy_context(context, llm_model_id, test_name)
+    llm_model = _model_from_context(context["model"])
+    test_name = context["test_name"]
+    test_result = TestResult(
+        test_run_id=context["test_run_id"],
+        llm_model_id=llm_model.id,
+        test_name=test_name
     )
-    
-    llm = get_llm(llm_model)
-    test_class = test_registry._tests[test_name]
-    test = test_class(product=test_run.product, product_category=test_run.product_category, product_description=test_run.product_description)
-    
+    started = time.monotonic()
+
+    with call_context(
+        cache_bypass=context["cache_bypass"],
+        cache_max_age=context.get("cache_max_age"),
+        cassette_mode=context.get("cassette_mode"),
+        cassette=context.get("cassette"),
+        test_name=test_name
+    ) as call:
+        if context.get("enqueued_at"):
+            call.tracer.add_span("queue", context["enqueued_at"], call.tracer.start - context["enqueued_at"])
+        with call.tracer.span("test", test_name=test_name, model=llm_model.model_name) as span:
+            with count_db_queries(call.stats):
+                raw_responses = _run_in_context(test_result, context, llm_model, call)
+            span["success"] = test_result.success
+            span["db_queries"] = int(call.stats.get("db_queries"))
+        stats = call.stats.as_dict()
+        _save_result(test_result, raw_responses, call.tracer)
+    _publish_result(test_result, llm_model.model_name)
+
+    outcome = "success" if test_result.success else "failure"
+    TESTS.inc(model=llm_model.model_name, test_name=test_name, outcome=outcome)
+    TEST_DURATION.observe(time.monotonic() - started, model=llm_model.model_name, test_name=test_name, outcome=outcome)
+    # Workers may be idle for a long time after their last task, so don't leave it unflushed
+    metrics.flush(force=True)
+
+    # Counters are added to the run by test_complete's single update
+    return {"test_result_id": test_result.id, "stats": stats}
+
+def _run_in_context(test_result: TestResult, context: dict, llm_model: LLMModel, call: LLMCallContext) -> list | None:
+    """Run the test inside the task's call context, filling in test_result and returning the raw responses"""
     try:
+        llm = get_llm(llm_model)
+        test_class = test_registry._tests[test_result.test_name]
+        test = test_class(product=context["product"], product_category=context["product_category"], product_description=context["product_description"])
+
+        # Keep answers cached at least as long as a recurring run may reuse them
+        call.cache_ttl = max(test_class.get_cache_ttl(), call.cache_max_age or 0)
         result = test.run(llm)
+        stats = call.stats.as_dict()
+        test_result.llm_calls = int(stats.get("llm_calls", 0))
+        test_result.prompt_tokens = int(stats.get("prompt_tokens", 0))
+        test_result.completion_tokens = int(stats.get("completion_tokens", 0))
+        test_result.llm_latency_seconds = stats.get("llm_latency_seconds", 0)
+        test_result.cost = Decimal(str(round(stats.get("cost", 0), 6)))
+        test_result.usage = call.stats.usage_by_model()
+
         test_result.success = result.success
         test_result.readable_response = result.readable_response
-        test_result.raw_responses = result.raw_responses
         test_result.structured_data = result.structured_data
         test_result.metadata = result.metadata
         test_result.error = result.error
-        test_result.test_name = test_name
-        test_result.save()
-        
-        return test_result.id
+        return result.raw_responses
     except Exception as e:
-        # Update test result with the error
+        # Record the error on the test result
         test_result.success = False
         test_result.error = str(e)
-        test_result.test_name = test_name
-        test_result.save()
-        
-        return test_result.id
+        return None
     
 def test_complete(task):
     """Hook that runs when an individual test completes"""
-    test_run_id = task.args[0]  # First argument was test_run_id
-    
-    test_run = TestRun.objects.get(id=test_run_id)
+    test_run_id = _task_test_run_id(task.args)
     
     # Check if the task failed
-    if task.success is False:
-        test_run.status = TestRun.Status.FAILED
-        test_run.save()
+    failed = task.success is False
+    if failed:
         logger.error(f"Test run {test_run_id} failed: {task.result}")
-        return
-    
-    test_run.completed_tests = F('completed_tests') + 1
-    test_run.save()
-    
-    # Refresh from database to get actual values
-    test_run.refresh_from_db()
-    
-    # Check if all tests are complete
-    if test_run.completed_tests == test_run.total_tests:
-        test_run.status = TestRun.Status.COMPLETED
-        test_run.save()
\ No newline at end of file
+        stats = {}
+    else:
+        stats = task.result.get("stats", {}) if isinstance(task.result, dict) else {}
+
+    TEST_COMPLETIONS.inc(outcome="failure" if failed else "success")
+    metrics.flush(force=True)
+
+    progress = record_test_completion(test_run_id, failed, stats)
+    if progress is not None:
+        publish_run_event(test_run_id, "progress", progress)
+        if progress["status"] != TestRun.Status.IN_PROGRESS:
+            # A finished batch run frees a slot for the batch's next pending run
+            if progress["batch_id"]:
+                dispatch_test_batch(progress["batch_id"])
+            if progress["previous_run_id"]:
+                async_task('core.tasks.recurring_tasks.diff_test_run', test_run_id)
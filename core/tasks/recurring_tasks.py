@@ -0,0 +1,59 @@
+# tasks/recurring_tasks.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django_q.models import Schedule
+from core.models import RecurringRun, TestRun
+from core.logic import initiate_test_run, build_run_diff
+
+def _schedule_name(recurring_run_id: str) -> str:
+    return f"recurring_run_{recurring_run_id}"
+
+def start_recurring_run(recurring_run_id: str):
+    """Scheduled task starting the next run of a recurring run, diffed against its latest finished run"""
+    recurring_run = RecurringRun.objects.filter(id=recurring_run_id, is_active=True).first()
+    if recurring_run is None:
+        return None
+
+    previous_run = recurring_run.runs.filter(
+        status__in=[TestRun.Status.COMPLETED, TestRun.Status.FAILED]
+    ).order_by('-date_created').first()
+    test_run = initiate_test_run(
+        recurring_run.product,
+        recurring_run.product_category,
+        recurring_run.product_description,
+        profile=recurring_run.profile,
+        recurring_run=recurring_run,
+        previous_run=previous_run
+    )
+    return test_run.id
+
+def diff_test_run(test_run_id: str):
+    """Store a finished run's changes against its previous run"""
+    test_run = TestRun.objects.filter(id=test_run_id).first()
+    if test_run is None:
+        return
+    test_run.diff = build_run_diff(test_run)
+    test_run.save(update_fields=['diff', 'date_modified'])
+
+@receiver(post_save, sender=RecurringRun)
+def schedule_recurring_run(sender, instance, **kwargs):
+    """Keep a django-q Schedule in step with each active recurring run"""
+    name = _schedule_name(instance.id)
+    if not instance.is_active:
+        Schedule.objects.filter(name=name).delete()
+        return
+
+    defaults = {
+        "func": 'core.tasks.recurring_tasks.start_recurring_run',
+        "args": repr((instance.id,)),
+        "schedule_type": Schedule.MINUTES,
+        "minutes": instance.interval_hours * 60,
+        "repeats": -1
+    }
+    # New schedules start right away; existing ones keep their next_run
+    Schedule.objects.update_or_create(name=name, defaults=defaults, create_defaults={**defaults, "next_run": timezone.now()})
+
+@receiver(post_delete, sender=RecurringRun)
+def unschedule_recurring_run(sender, instance, **kwargs):
+    Schedule.objects.filter(name=_schedule_name(instance.id)).delete()
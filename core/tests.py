@@ -1,3 +1,414 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from email.utils import format_datetime
+from unittest import mock, skipUnless
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from core.llms.adapters.base import CircuitBreaker, CircuitOpenError, LLMRequestError, RetryPolicy, parse_retry_after
+from core.llms.adapters.openai import OpenAI
+from core.llms.context import call_context
+from core.llms.keyphrases import extract_keyphrases
+from core.llms.lexicon import score_sentiment
+from core.llms.mentions import MentionMatcher, build_aliases
+from core.llms.mock_gateway import MockGateway, MockGatewayConfig
+from core.llms.ratelimit import DatabaseRateLimitBackend, LocalRateLimitBackend, RateLimiter, RateLimitExceededError
+from core.llms.tests.sentiment import SentimentAnalysisTest
+from core.llms.tests.sentiment_analysis import ProductSentimentAnalysisTest
+from core.logic import record_test_completion
+from core.models import LLMModel, LLMProvider, RateLimitBucket, TestRun
+import requests
 
-# Create your tests here.
+class MockGatewayStructuredOutputTest(SimpleTestCase):
+    """Runs a real test class against the mock gateway through the OpenAI adapter"""
+
+    def setUp(self):
+        self.gateway = MockGateway(MockGatewayConfig(latency=0, distribution="fixed", seed=1))
+        server = self.gateway.start(port=0)
+        # Cleanups run last first: stop serving, then close the listening socket
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        patcher = mock.patch.object(OpenAI, "GATEWAY_URL", f"http://127.0.0.1:{server.server_address[1]}/")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        provider = LLMProvider(name="openai")
+        self.llm = OpenAI(LLMModel(
+            provider=provider,
+            model_name="gpt-mock",
+            capabilities=[LLMModel.Capabilities.CHAT, LLMModel.Capabilities.STRUCTURED_OUTPUT]
+        ))
+
+    def test_bare_schema_takes_structured_path(self):
+        with call_context(cache_bypass=True):
+            result = SentimentAnalysisTest("The app is fast and reliable").run(self.llm)
+
+        self.assertTrue(result.success, result.error)
+        self.assertEqual(self.gateway.requests, 1)
+        # Only the structured branch fills in a numeric confidence
+        self.assertIsInstance(result.structured_data["confidence"], float)
+        self.assertIn("confidence:", result.readable_response)
+
+    def test_structured_response_is_tagged(self):
+        schema = {"type": "object", "properties": {"sentiment": {"type": "string"}}, "required": ["sentiment"]}
+        completion = self.gateway.completion({"messages": [{"role": "user", "content": "hi"}], "response_format": schema})
+
+        self.assertEqual(completion["usage"]["system_tags"], ["response_format"])
+        self.assertIsInstance(self.llm.process_response(completion), dict)
+
+class MentionMatcherTest(SimpleTestCase):
+    def matcher(self, *names: str) -> MentionMatcher:
+        return MentionMatcher({name: build_aliases(name) for name in names})
+
+    def test_aliases(self):
+        self.assertEqual(build_aliases("PhotoAI.com"), ["Photo AI", "PhotoAI", "PhotoAI.com"])
+        self.assertEqual(build_aliases("Photo  AI"), ["Photo AI", "PhotoAI"])
+        self.assertEqual(build_aliases("iPhone"), ["iPhone"])
+        self.assertEqual(build_aliases("OpenAI"), ["Open AI", "OpenAI"])
+
+    def test_ordinary_phrases_are_not_mentions(self):
+        matcher = self.matcher("BetterPic", "LinkedIn", "FaceApp", "HeadshotPro.com", "PhotoRoom")
+        for phrase in ("take a better pic", "linked in the footer", "any face app", "hire a headshot pro", "a photo room"):
+            self.assertEqual(matcher.matches(phrase), [], phrase)
+
+    def test_domain_name_matches_spaced_brand(self):
+        counts = self.matcher("PhotoAI.com").count("Photo AI and photoai both beat PHOTOAI.COM")
+        self.assertEqual(counts["PhotoAI.com"], 3)
+
+    def test_whole_words_only(self):
+        matcher = self.matcher("Canva")
+        self.assertEqual(matcher.count("Canva's editor")["Canva"], 1)
+        self.assertEqual(matcher.count("Paint on canvas, not Canvaly")["Canva"], 0)
+
+    def test_leftmost_longest_wins(self):
+        matcher = self.matcher("Photo", "PhotoAI.com")
+        text = "Use PhotoAI.com, or a photo editor"
+        self.assertEqual(
+            [(text.casefold()[start:end], name) for start, end, name in matcher.matches(text)],
+            [("photoai.com", "PhotoAI.com"), ("photo", "Photo")]
+        )
+        # "Photo AI" is one mention of PhotoAI.com, not a mention of Photo
+        self.assertEqual(matcher.count("Photo AI is good"), {"PhotoAI.com": 1})
+
+class KeyphraseExtractionTest(SimpleTestCase):
+    ANSWERS = [
+        "For AI headshots, PhotoAI.com stands out for realistic portraits and fast turnaround. "
+        "Canva is better known for graphic design templates and social media posts.",
+        "PhotoAI creates realistic portraits from a handful of selfies. "
+        "If you need graphic design templates, Canva remains the usual pick.",
+        "Many photographers mention Photo AI for realistic portraits, while Canva offers "
+        "drag-and-drop graphic design templates for marketing teams.",
+        "Canva has graphic design templates for presentations. "
+        "PhotoAI.com focuses on realistic portraits with studio lighting.",
+    ]
+
+    def setUp(self):
+        matcher = MentionMatcher({name: build_aliases(name) for name in ("PhotoAI.com", "Canva")})
+        self.matches = [matcher.matches(answer) for answer in self.ANSWERS]
+
+    def test_brand_and_competitor_keyphrases_separate(self):
+        brand = extract_keyphrases(self.ANSWERS, self.matches, ["PhotoAI.com"])
+        competitor = extract_keyphrases(self.ANSWERS, self.matches, ["Canva"])
+
+        self.assertEqual(brand[0], "realistic portraits")
+        self.assertEqual(competitor[0], "graphic design templates")
+        self.assertFalse(set(brand) & set(competitor))
+
+    def test_mentions_are_not_keyphrases(self):
+        keyphrases = extract_keyphrases(self.ANSWERS, self.matches, ["PhotoAI.com", "Canva"])
+        self.assertFalse({"photoai", "com", "canva"} & {word for phrase in keyphrases for word in phrase.split()})
+
+    def test_no_mentions(self):
+        self.assertEqual(extract_keyphrases(["Nothing relevant here."], [[]], ["Canva"]), [])
+
+class LexiconTest(SimpleTestCase):
+    def test_clear_opinions_are_confident(self):
+        positive = score_sentiment("Excellent, reliable and easy to use.")
+        negative = score_sentiment("Terrible support and buggy releases.")
+        self.assertEqual(positive["sentiment"], "positive")
+        self.assertEqual(negative["sentiment"], "negative")
+        self.assertGreaterEqual(positive["confidence"], 0.7)
+        self.assertGreaterEqual(negative["confidence"], 0.7)
+
+    def test_negation_flips(self):
+        self.assertEqual(score_sentiment("I would not recommend it.")["sentiment"], "negative")
+        self.assertEqual(score_sentiment("It is not good enough.")["sentiment"], "negative")
+
+    def test_emphatic_negation(self):
+        self.assertEqual(score_sentiment("I cannot recommend it highly enough.")["sentiment"], "positive")
+        self.assertEqual(score_sentiment("I can't praise the team enough.")["sentiment"], "positive")
+
+    def test_contrast_outweighs_what_came_before(self):
+        self.assertEqual(score_sentiment("The app is good, but slow and expensive.")["sentiment"], "negative")
+
+    def test_mixed_and_empty_text_is_uncertain(self):
+        self.assertLess(score_sentiment("The interface is good, but some users report issues.")["confidence"], 0.7)
+        self.assertEqual(score_sentiment("It exists."), {
+            "sentiment": "neutral", "confidence": 0.0, "explanation": "No sentiment-bearing words", "score": 0.0
+        })
+
+class ProductSentimentCascadeTest(SimpleTestCase):
+    OPINIONS = [
+        "Excellent, reliable and easy to use.",
+        "Terrible support and buggy releases.",
+        "The interface is good, but some users report issues.",
+    ]
+    LLM_SENTIMENT = {"sentiment": "neutral", "confidence": 0.8, "explanation": "Mixed"}
+
+    def setUp(self):
+        self.test = ProductSentimentAnalysisTest("PhotoAI.com", "AI Photography", "AI headshots")
+        patcher = mock.patch.object(ProductSentimentAnalysisTest, "get_analysis_llm", return_value=mock.Mock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def analyze_batch(self, sentiments):
+        return mock.patch.object(SentimentAnalysisTest, "analyze_batch", return_value=(sentiments, []))
+
+    def test_only_uncertain_opinions_escalate(self):
+        with self.analyze_batch([self.LLM_SENTIMENT]) as analyze_batch:
+            sentiments, stages = self.test._classify(self.OPINIONS)
+
+        self.assertEqual(analyze_batch.call_args.args[1], [self.OPINIONS[2]])
+        self.assertEqual(stages, ["lexicon", "lexicon", "llm"])
+        self.assertEqual(sentiments[2], self.LLM_SENTIMENT)
+
+    def test_threshold_controls_escalation(self):
+        self.test.local_confidence_threshold = 0
+        with self.analyze_batch([]) as analyze_batch:
+            _, stages = self.test._classify(self.OPINIONS)
+        analyze_batch.assert_not_called()
+        self.assertEqual(stages, ["lexicon"] * 3)
+
+        self.test.local_confidence_threshold = 1.01
+        with self.analyze_batch([self.LLM_SENTIMENT, None, self.LLM_SENTIMENT]):
+            _, stages = self.test._classify(self.OPINIONS)
+        # The lexicon's answer stands where the LLM's couldn't be parsed
+        self.assertEqual(stages, ["llm", "lexicon", "llm"])
+
+    def test_decided_by(self):
+        opinions = [{"prompt": f"Prompt {i}", "response": opinion} for i, opinion in enumerate(self.OPINIONS)]
+        with mock.patch.object(ProductSentimentAnalysisTest, "_get_product_opinions", return_value=opinions), \
+                self.analyze_batch([self.LLM_SENTIMENT]), self.settings(STORE_RAW_RESPONSES=False):
+            result = self.test.run(mock.Mock())
+
+        self.assertTrue(result.success, result.error)
+        self.assertEqual(result.metadata["decided_by"], {"lexicon": 2, "llm": 1})
+        self.assertEqual([r["stage"] for r in result.structured_data["detailed_results"]], ["lexicon", "lexicon", "llm"])
+
+@skipUnless(connection.vendor == "postgresql", "record_test_completion is written for Postgres")
+class RecordTestCompletionTest(TestCase):
+    def create_run(self, total_tests: int = 2) -> TestRun:
+        return TestRun.objects.create(product="PhotoAI.com", status=TestRun.Status.IN_PROGRESS, total_tests=total_tests)
+
+    def test_last_test_completes_run(self):
+        test_run = self.create_run()
+        stats = {"cache_hits": 1, "prompt_tokens": 100, "completion_tokens": 50, "cost": 0.25}
+
+        progress = record_test_completion(test_run.id, False, stats)
+        self.assertEqual(progress["status"], TestRun.Status.IN_PROGRESS)
+        self.assertEqual(progress["completed_tests"], 1)
+
+        progress = record_test_completion(test_run.id, False, stats)
+        self.assertEqual(progress["status"], TestRun.Status.COMPLETED)
+        self.assertEqual(progress["completed_tests"], 2)
+        self.assertEqual(progress["prompt_tokens"], 200)
+        self.assertEqual(progress["cost"], Decimal("0.5"))
+
+        test_run.refresh_from_db()
+        self.assertEqual(test_run.status, TestRun.Status.COMPLETED)
+        self.assertEqual(test_run.cache_hits, 2)
+
+    def test_any_failure_fails_run(self):
+        test_run = self.create_run()
+        record_test_completion(test_run.id, True)
+        progress = record_test_completion(test_run.id, False)
+
+        self.assertEqual(progress["status"], TestRun.Status.FAILED)
+        self.assertEqual(progress["failed_tests"], 1)
+
+    def test_counting_after_finish_keeps_status(self):
+        test_run = self.create_run(total_tests=1)
+        record_test_completion(test_run.id, False)
+        progress = record_test_completion(test_run.id, True)
+
+        self.assertEqual(progress["status"], TestRun.Status.COMPLETED)
+        self.assertEqual(progress["completed_tests"], 2)
+        self.assertEqual(progress["failed_tests"], 1)
+
+    def test_missing_run(self):
+        self.assertIsNone(record_test_completion("missing", False))
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("core.llms.adapters.base.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    def open_circuit(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_single_probe_after_reset_timeout(self):
+        self.open_circuit()
+        self.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_failed_probe_reopens(self):
+        self.open_circuit()
+        self.now += 30
+        self.breaker.allow_request()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_probe_that_never_reports_is_replaced(self):
+        self.open_circuit()
+        self.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.now += 29
+        self.assertFalse(self.breaker.allow_request())
+        self.now += 1
+        self.assertTrue(self.breaker.allow_request())
+
+class RetryPolicyTest(SimpleTestCase):
+    def test_is_retryable(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.is_retryable(LLMRequestError("rate limited", status_code=429)))
+        self.assertTrue(policy.is_retryable(LLMRequestError("server error", status_code=503)))
+        self.assertTrue(policy.is_retryable(LLMRequestError("no status")))
+        self.assertFalse(policy.is_retryable(LLMRequestError("bad request", status_code=400)))
+        self.assertFalse(policy.is_retryable(CircuitOpenError("open")))
+        self.assertTrue(policy.is_retryable(requests.ConnectionError()))
+        self.assertTrue(policy.is_retryable(requests.Timeout()))
+        self.assertFalse(policy.is_retryable(ValueError()))
+
+    def test_exponential_backoff(self):
+        policy = RetryPolicy(base_delay=0.5, max_delay=3, jitter=0)
+        error = LLMRequestError("server error", status_code=500)
+        self.assertEqual([policy.get_delay(attempt, error) for attempt in range(1, 5)], [0.5, 1, 2, 3])
+
+    def test_jitter_stays_within_backoff(self):
+        policy = RetryPolicy(base_delay=1, jitter=0.5)
+        for _ in range(20):
+            self.assertTrue(0.5 <= policy.get_delay(1, ValueError()) <= 1)
+
+    def test_retry_after_wins_up_to_max_delay(self):
+        policy = RetryPolicy(max_delay=30)
+        self.assertEqual(policy.get_delay(1, LLMRequestError("limited", status_code=429, retry_after=7)), 7)
+        self.assertEqual(policy.get_delay(1, LLMRequestError("limited", status_code=429, retry_after=120)), 30)
+
+class ParseRetryAfterTest(SimpleTestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("5"), 5)
+        self.assertEqual(parse_retry_after("1.5"), 1.5)
+        self.assertEqual(parse_retry_after("-3"), 0)
+
+    def test_http_date(self):
+        future = datetime.now(dt_timezone.utc) + timedelta(seconds=60)
+        self.assertAlmostEqual(parse_retry_after(format_datetime(future, usegmt=True)), 60, delta=2)
+        past = datetime.now(dt_timezone.utc) - timedelta(seconds=60)
+        self.assertEqual(parse_retry_after(format_datetime(past, usegmt=True)), 0)
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after(""))
+        self.assertIsNone(parse_retry_after("soon"))
+
+class LocalRateLimitBackendTest(SimpleTestCase):
+    # Two requests a minute and 150 tokens a minute
+    RPM = ("rpm:openai:gpt", 1, 2, 2 / 60)
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("core.llms.ratelimit.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend = LocalRateLimitBackend()
+
+    def tpm(self, tokens: int) -> tuple:
+        return ("tpm:openai:gpt", tokens, 150, 150 / 60)
+
+    def test_waits_for_refill(self):
+        self.assertEqual(self.backend.reserve([self.RPM]), 0)
+        self.assertEqual(self.backend.reserve([self.RPM]), 0)
+        self.assertAlmostEqual(self.backend.reserve([self.RPM]), 30)
+        self.now += 30
+        self.assertAlmostEqual(self.backend.reserve([self.RPM]), 30)
+
+    def test_longest_wait_across_buckets(self):
+        self.assertEqual(self.backend.reserve([self.RPM, self.tpm(100)]), 0)
+        self.assertAlmostEqual(self.backend.reserve([self.RPM, self.tpm(100)]), 20)
+
+    def test_wait_over_max_takes_nothing(self):
+        self.backend.reserve([self.RPM, self.tpm(150)])
+        self.assertAlmostEqual(self.backend.reserve([self.RPM, self.tpm(150)], max_wait=5), 60)
+        # The refused reservation left both buckets as they were
+        self.assertEqual(self.backend.reserve([self.RPM]), 0)
+        self.assertAlmostEqual(self.backend.reserve([self.tpm(150)]), 60)
+
+class RateLimiterTest(SimpleTestCase):
+    def setUp(self):
+        self.limiter = RateLimiter()
+        self.limiter.backend = LocalRateLimitBackend()
+        self.model = LLMModel(model_name="gpt", requests_per_minute=1)
+        patcher = mock.patch("core.llms.ratelimit.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unlimited_model_never_waits(self):
+        self.assertEqual(self.limiter.acquire("openai", LLMModel(model_name="gpt"), {}), 0)
+
+    def test_sleeps_for_the_wait(self):
+        self.limiter.acquire("openai", self.model, {})
+        waited = self.limiter.acquire("openai", self.model, {})
+        self.assertAlmostEqual(waited, 60, delta=1)
+        self.sleep.assert_called_once_with(waited)
+
+    def test_fails_fast_over_max_wait(self):
+        self.limiter.MAX_WAIT = 5
+        self.limiter.acquire("openai", self.model, {})
+        with self.assertRaises(RateLimitExceededError):
+            self.limiter.acquire("openai", self.model, {})
+        self.sleep.assert_not_called()
+
+class DatabaseRateLimitBackendTest(TestCase):
+    RPM = ("rpm:openai:gpt", 1, 2, 2 / 60)
+    TPM = ("tpm:openai:gpt", 100, 150, 150 / 60)
+
+    def test_reserves_buckets_together(self):
+        backend = DatabaseRateLimitBackend()
+        self.assertEqual(backend.reserve([self.RPM, self.TPM]), 0)
+        levels = dict(RateLimitBucket.objects.values_list("key", "level"))
+        self.assertAlmostEqual(levels["rpm:openai:gpt"], 1, places=2)
+        self.assertAlmostEqual(levels["tpm:openai:gpt"], 50, places=1)
+
+        self.assertAlmostEqual(backend.reserve([self.RPM, self.TPM]), 20, delta=0.5)
+
+    def test_wait_over_max_takes_nothing(self):
+        backend = DatabaseRateLimitBackend()
+        backend.reserve([self.RPM, self.TPM])
+        before = dict(RateLimitBucket.objects.values_list("key", "level"))
+
+        self.assertGreater(backend.reserve([self.RPM, self.TPM], max_wait=5), 5)
+        after = dict(RateLimitBucket.objects.values_list("key", "level"))
+        self.assertEqual(before, after)
@@ -4,4 +4,7 @@ from . import views
 urlpatterns = [
     path("", views.Home.as_view(), name="Home"),
     path('test-progress/<str:test_run_id>/', views.check_test_progress, name='test_progress'),
+    path('test-progress/<str:test_run_id>/stream/', views.stream_test_progress, name='test_progress_stream'),
+    path('batch-progress/<str:batch_id>/', views.check_batch_progress, name='batch_progress'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,8 +1,20 @@
 from django.shortcuts import render
 from django.views import View
 from django.contrib.sites.models import Site
-from django.http import JsonResponse
-from core.logic import get_test_run_progress
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponse
+from django.conf import settings
+from django.db import connection
+from asgiref.sync import sync_to_async
+from core.logic import get_test_run_progress, get_test_batch_progress
+from core.models import TestRun
+from core.events import run_event_hub
+from core.metrics import metrics as metrics_registry
+import asyncio
+import json
+
+# Seconds between SSE keep-alive comments on an idle progress stream
+STREAM_HEARTBEAT_SECONDS = 15
+FINISHED_STATUSES = (TestRun.Status.COMPLETED, TestRun.Status.FAILED)
 
 # Create your views here.
 class Home(View):
@@ -12,4 +24,60 @@ class Home(View):
 
 def check_test_progress(request, test_run_id):
     progress = get_test_run_progress(test_run_id)
-    return JsonResponse(progress)
\ No newline at end of file
+    return JsonResponse(progress)
+
+def check_batch_progress(request, batch_id):
+    progress = get_test_batch_progress(batch_id)
+    return JsonResponse(progress)
+
+def metrics(request):
+    """Prometheus text-format metrics, guarded by settings.METRICS_TOKEN when set"""
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(metrics_registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_test_progress(request, test_run_id):
+    """
+    Server-sent events for a test run: a progress snapshot, then a "result"
+    event per finished test and "progress" events until the run finishes.
+    Progress is re-read on every heartbeat, so a run that finishes while the
+    listener is reconnecting still ends the stream.
+    """
+    # Subscribe before taking the snapshot so no event falls between the two
+    listening = connection.vendor == "postgresql"
+    queue = await run_event_hub.subscribe(test_run_id) if listening else None
+
+    async def events():
+        try:
+            progress = await sync_to_async(get_test_run_progress)(test_run_id)
+            yield _sse("progress", progress)
+            if not listening or "error" in progress or progress["status"] in FINISHED_STATUSES:
+                return
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Events sent while the listener was down are lost, so check the run directly
+                    progress = await sync_to_async(get_test_run_progress)(test_run_id)
+                    if "error" in progress or progress["status"] in FINISHED_STATUSES:
+                        yield _sse("progress", progress)
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield _sse(event["type"], event)
+                if event.get("status") in FINISHED_STATUSES:
+                    return
+        finally:
+            if listening:
+                run_event_hub.unsubscribe(test_run_id, queue)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response